@@ -10,203 +10,124 @@
 # DB file created locally as: milestone1.db
 # -------------------------------------------------------------
 
+import os
+import html
+import time
+import uuid
 import streamlit as st
-import sqlite3
-import bcrypt
-import secrets
-from datetime import datetime
 
 st.set_page_config(page_title="Milestone 1: Working Application", layout="wide")
 
-# Optional parsers for multi-format upload
-try:
-    from docx import Document as DocxDocument  # python-docx
-except Exception:
-    DocxDocument = None
+# Text extraction for TXT/DOCX/PDF uploads (streamed to disk; see extraction.py)
+from extraction import extract_upload
+
+# ---------------------------
+# Database helpers (pooled, WAL-mode SQLite; see db.py)
+# ---------------------------
+from db import (
+    init_db,
+    add_user,
+    verify_user,
+    LoginThrottled,
+    create_reset_token,
+    reset_password,
+    save_document,
+    list_documents,
+    count_documents,
+    get_document,
+    delete_document,
+    search_documents,
+    SNIPPET_START,
+    SNIPPET_END,
+)
+from passwords import PasswordHasherBusy, stats as password_stats
+
+# In-process metrics registry; METRICS_PORT also serves it on /metrics
+import metrics
+
+if os.environ.get("METRICS_PORT"):
+    metrics.start_http_server(int(os.environ["METRICS_PORT"]))
+
+DOCS_PAGE_SIZE = 20
 
-try:
-    from PyPDF2 import PdfReader
-except Exception:
-    PdfReader = None
 
 # ---------------------------
-# Database helpers
+# Utility: extraction progress
 # ---------------------------
-DB_PATH = "milestone1.db"
+def progress_callback(bar, label: str):
+    # Only touch the widget when the whole-percent value changes
+    last = {"pct": -1}
 
+    def update(done: int, total: int):
+        pct = int(100 * done / total) if total else 100
+        if pct != last["pct"]:
+            last["pct"] = pct
+            bar.progress(pct / 100, text=f"{label}... {pct}%")
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return update
 
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash BLOB NOT NULL,
-            reset_token TEXT,
-            created_at TEXT NOT NULL
-        );
-        """
-    )
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS documents(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            filename TEXT,
-            mime TEXT,
-            content TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        );
-        """
-    )
-    conn.commit()
-    conn.close()
-
-
-def add_user(email: str, password: str) -> tuple[bool, str]:
-    if not email or not password:
-        return False, "Email and password are required."
-    pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-    try:
-        conn = get_conn()
-        conn.execute(
-            "INSERT INTO users(email, password_hash, created_at) VALUES(?,?,?)",
-            (email.strip().lower(), pw_hash, datetime.utcnow().isoformat()),
-        )
-        conn.commit()
-        conn.close()
-        return True, "Registration successful."
-    except sqlite3.IntegrityError:
-        return False, "Email already registered."
-    except Exception as e:
-        return False, f"Registration failed: {e}"
-
-
-def verify_user(email: str, password: str):
-    conn = get_conn()
-    row = conn.execute(
-        "SELECT id, email, password_hash FROM users WHERE email=?",
-        (email.strip().lower(),),
-    ).fetchone()
-    conn.close()
-    if not row:
-        return None
-    try:
-        if bcrypt.checkpw(password.encode("utf-8"), row["password_hash"]):
-            return {"id": row["id"], "email": row["email"]}
-    except Exception:
-        pass
-    return None
-
-
-def create_reset_token(email: str) -> str | None:
-    token = secrets.token_hex(16)  # 32-char secure token
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE users SET reset_token=? WHERE email=?",
-        (token, email.strip().lower()),
-    )
-    conn.commit()
-    if cur.rowcount == 0:  # no matching email
-        conn.close()
-        return None
-    conn.close()
-    return token
-
-
-def reset_password(email: str, token: str, new_password: str) -> tuple[bool, str]:
-    conn = get_conn()
-    row = conn.execute(
-        "SELECT reset_token FROM users WHERE email=?", (email.strip().lower(),)
-    ).fetchone()
-    if not row or row["reset_token"] != token:
-        conn.close()
-        return False, "Invalid or expired reset token."
-
-    pw_hash = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt())
-    conn.execute(
-        "UPDATE users SET password_hash=?, reset_token=NULL WHERE email=?",
-        (pw_hash, email.strip().lower()),
-    )
-    conn.commit()
-    conn.close()
-    return True, "Password has been reset successfully."
+# ---------------------------
+# Metric cards (values from metrics.py; see the bottom of the page)
+# ---------------------------
+def fmt_seconds(seconds: float | None) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} ms" if seconds >= 0.001 else f"{seconds * 1000:.2f} ms"
+    return f"{seconds:.2f} s"
 
 
-def save_document(user_id: int, content: str, filename: str | None, mime: str | None):
-    conn = get_conn()
-    conn.execute(
-        "INSERT INTO documents(user_id, filename, mime, content, created_at) VALUES(?,?,?,?,?)",
-        (user_id, filename, mime, content, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-    conn.close()
+def fmt_duration(seconds: float) -> str:
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m"
+
 
+def latency_pair(hist) -> str:
+    # hist is None for metrics this process has not registered yet
+    if hist is None:
+        return "— / —"
+    return f"{fmt_seconds(hist.quantile(0.50))} / {fmt_seconds(hist.quantile(0.95))}"
 
-def list_documents(user_id: int):
-    conn = get_conn()
-    rows = conn.execute(
-        "SELECT id, filename, mime, content, created_at FROM documents WHERE user_id=? ORDER BY id DESC",
-        (user_id,),
-    ).fetchall()
-    conn.close()
-    return rows
 
+def rate(part: float, whole: float) -> str:
+    return f"{100 * part / whole:.1f}%" if whole else "—"
 
-def delete_document(doc_id: int, user_id: int):
-    conn = get_conn()
-    conn.execute("DELETE FROM documents WHERE id=? AND user_id=?", (doc_id, user_id))
-    conn.commit()
-    conn.close()
+
+def throughput(n_bytes: float, seconds: float) -> str:
+    return f"{n_bytes / seconds / 1e6:.1f} MB/s" if seconds else "— MB/s"
+
+
+def metric_card(col, value: str, label: str, detail: str):
+    col.markdown(
+        f"<div class='metric-card'><div class='metric-value'>{html.escape(value)}</div>"
+        f"<div class='metric-label'>{html.escape(label)}<br>{html.escape(detail)}</div></div>",
+        unsafe_allow_html=True,
+    )
 
 
 # ---------------------------
-# Utility: extract text
+# Document card (library listing and search results)
 # ---------------------------
-def read_text_from_upload(uploaded_file) -> tuple[str, str, str]:
-    filename = uploaded_file.name
-    mime = uploaded_file.type or ""
-    name_lower = filename.lower()
-
-    if name_lower.endswith(".txt"):
-        text = uploaded_file.read().decode("utf-8", errors="ignore")
-        return text, filename, mime
-
-    if name_lower.endswith(".docx"):
-        if DocxDocument is None:
-            raise RuntimeError("python-docx not installed. Run: pip install python-docx")
-        doc = DocxDocument(uploaded_file)
-        text = "\n".join([p.text for p in doc.paragraphs])
-        return text, filename, mime
-
-    if name_lower.endswith(".pdf"):
-        if PdfReader is None:
-            raise RuntimeError("PyPDF2 not installed. Run: pip install PyPDF2")
-        reader = PdfReader(uploaded_file)
-        pages = []
-        for p in reader.pages:
-            try:
-                pages.append(p.extract_text() or "")
-            except Exception:
-                pages.append("")
-        text = "\n".join(pages)
-        return text, filename, mime
-
-    try:
-        text = uploaded_file.read().decode("utf-8", errors="ignore")
-        return text, filename, mime
-    except Exception:
-        raise RuntimeError("Unsupported file type. Please upload TXT, DOCX, or PDF.")
+def render_document_card(row, body_html: str, user_id: int):
+    # body_html is already escaped by the caller; the row fields are escaped here
+    with st.container():
+        st.markdown(
+            f"<div class='card'><b>#{row['id']}</b> — {html.escape(row['filename'] or 'Untitled')} "
+            f"<br><span style='font-size:12px;opacity:0.7'>{html.escape(str(row['created_at']))}</span>"
+            f"<br><br>{body_html}</div>",
+            unsafe_allow_html=True,
+        )
+        cols = st.columns([0.15, 0.15, 0.7])
+        if cols[0].button("View", key=f"view_{row['id']}"):
+            doc = get_document(row["id"], user_id)
+            if doc:
+                st.text_area(f"Document #{row['id']}", doc["content"], height=240)
+        if cols[1].button("Delete", key=f"del_{row['id']}"):
+            delete_document(row["id"], user_id)
+            st.success(f"Deleted document #{row['id']}")
+            st.rerun()
 
 
 # ---------------------------
@@ -256,7 +177,14 @@ def inject_css():
 # ---------------------------
 # Streamlit App
 # ---------------------------
-init_db()
+@st.cache_resource
+def _init_db_once():
+    # Schema check/migration once per server process, not on every rerun
+    init_db()
+    return True
+
+
+_init_db_once()
 inject_css()
 
 st.markdown("<div class='badge'>Weeks 1–2</div>", unsafe_allow_html=True)
@@ -266,6 +194,8 @@ st.caption("User Authentication, Forgot Password & Document Ingestion")
 # Session
 if "user" not in st.session_state:
     st.session_state.user = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Layout
 left, right = st.columns([2.2, 1.0], gap="large")
@@ -286,12 +216,16 @@ with left:
             password = st.text_input("Password", type="password", placeholder="••••••••")
             submitted = st.button("Sign In", type="primary", use_container_width=True)
             if submitted:
-                user = verify_user(email, password)
-                if user:
-                    st.session_state.user = user
-                    st.success("Login successful.")
+                try:
+                    user = verify_user(email, password, st.session_state.session_id)
+                except (LoginThrottled, PasswordHasherBusy) as e:
+                    st.warning(str(e))
                 else:
-                    st.error("Invalid email or password.")
+                    if user:
+                        st.session_state.user = user
+                        st.success("Login successful.")
+                    else:
+                        st.error("Invalid email or password.")
 
             with st.expander("Don't have an account? Register"):
                 r_email = st.text_input("New Email", key="reg_email")
@@ -316,7 +250,10 @@ with left:
                 fp_token = st.text_input("Reset Token", key="fp_token")
                 fp_newpwd = st.text_input("New Password", type="password", key="fp_newpwd")
                 if st.button("Reset Password", key="fp_reset_btn"):
-                    ok, msg = reset_password(fp_email, fp_token, fp_newpwd)
+                    try:
+                        ok, msg = reset_password(fp_email, fp_token, fp_newpwd)
+                    except PasswordHasherBusy as e:
+                        ok, msg = False, str(e)
                     if ok:
                         st.success(msg)
                     else:
@@ -332,30 +269,37 @@ with left:
             paste_text = st.text_area("Paste text here (optional)", height=180, placeholder="Paste the content...")
             uploaded_file = st.file_uploader("Or upload a file", type=["txt", "docx", "pdf"])
 
-            extracted_text, filename, mime = "", None, None
+            extracted, filename, mime = None, None, None
             if uploaded_file is not None:
                 try:
-                    extracted_text, filename, mime = read_text_from_upload(uploaded_file)
-                    st.success(f"Parsed **{filename}**")
+                    label = f"Extracting {uploaded_file.name}"
+                    bar = st.progress(0.0, text=f"{label}...")
+                    extracted = extract_upload(uploaded_file, progress_callback(bar, label))
+                    bar.empty()
+                    filename, mime = extracted.filename, extracted.mime
+                    st.success(f"Parsed **{filename}**" + (" (cached)" if extracted.cached else ""))
                     with st.expander("Preview extracted text"):
-                        st.write(extracted_text[:2000] + ("..." if len(extracted_text) > 2000 else ""))
+                        st.write(extracted.preview(2000) + ("..." if extracted.length > 2000 else ""))
                 except Exception as e:
                     st.error(str(e))
 
             if st.button("Save Document", type="primary"):
                 final_text = (paste_text or "").strip()
-                if not final_text and extracted_text:
-                    final_text = extracted_text.strip()
+                if not final_text and extracted is not None:
+                    final_text = extracted.read().strip()
                 if not final_text:
                     st.error("No content to save. Paste text or upload a file first.")
                 else:
-                    save_document(
+                    doc_id, created = save_document(
                         st.session_state.user["id"],
                         final_text,
                         filename or "pasted_text.txt",
                         mime or "text/plain",
                     )
-                    st.success("Document saved to your library.")
+                    if created:
+                        st.success("Document saved to your library.")
+                    else:
+                        st.info(f"This document is already in your library (#{doc_id}).")
 
     # ---------------- Documents Tab ----------------
     with tab_docs:
@@ -363,25 +307,46 @@ with left:
         if not st.session_state.user:
             st.warning("Please login to view your documents.")
         else:
-            docs = list_documents(st.session_state.user["id"])
-            if not docs:
-                st.info("No documents uploaded yet.")
+            user_id = st.session_state.user["id"]
+            query = st.text_input("Search your documents", key="docs_query", placeholder="Search by words in the text or filename")
+            if query.strip():
+                # Full-text search (FTS5), ranked by relevance, scoped to this user
+                results = search_documents(user_id, query)
+                if not results:
+                    st.info("No documents match your search.")
+                else:
+                    st.caption(f"{len(results)} matching document(s)")
+                for row in results:
+                    snippet = html.escape(row["snippet"] or "")
+                    snippet = snippet.replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+                    render_document_card(row, snippet, user_id)
             else:
-                for row in docs:
-                    with st.container():
-                        st.markdown(
-                            f"<div class='card'><b>#{row['id']}</b> — {row['filename'] or 'Untitled'} "
-                            f"<br><span style='font-size:12px;opacity:0.7'>{row['created_at']}</span>"
-                            f"<br><br>{(row['content'][:280] + ('...' if len(row['content'])>280 else ''))}</div>",
-                            unsafe_allow_html=True,
+                total = count_documents(user_id)
+                if not total:
+                    st.info("No documents uploaded yet.")
+                else:
+                    # Only metadata and previews are fetched, one page at a time
+                    pages = (total + DOCS_PAGE_SIZE - 1) // DOCS_PAGE_SIZE
+                    page = st.session_state.get("docs_page", 1)
+                    page = min(max(page, 1), pages)
+                    st.session_state.docs_page = page
+                    docs = list_documents(user_id, DOCS_PAGE_SIZE, (page - 1) * DOCS_PAGE_SIZE)
+                    for row in docs:
+                        render_document_card(
+                            row,
+                            html.escape(row["preview"]) + ("..." if row["length"] > len(row["preview"]) else ""),
+                            user_id,
                         )
-                        cols = st.columns([0.15, 0.15, 0.7])
-                        if cols[0].button("View", key=f"view_{row['id']}"):
-                            st.text_area(f"Document #{row['id']}", row["content"], height=240)
-                        if cols[1].button("Delete", key=f"del_{row['id']}"):
-                            delete_document(row["id"], st.session_state.user["id"])
-                            st.success(f"Deleted document #{row['id']}")
+
+                    if pages > 1:
+                        pc1, pc2, pc3 = st.columns([0.15, 0.15, 0.7])
+                        if pc1.button("← Prev", key="docs_prev", disabled=page == 1):
+                            st.session_state.docs_page = page - 1
                             st.rerun()
+                        if pc2.button("Next →", key="docs_next", disabled=page == pages):
+                            st.session_state.docs_page = page + 1
+                            st.rerun()
+                        pc3.caption(f"Page {page} of {pages} · {total} documents")
 
 with right:
     st.markdown("#### Platform Highlights")
@@ -389,16 +354,45 @@ with right:
     st.markdown("<div class='card'><b>📂 Multi-Format Upload</b><br>Supports TXT, DOCX, and PDF.</div>", unsafe_allow_html=True)
     st.markdown("<div class='card'><b>📜 Document History</b><br>Personal library for your documents.</div>", unsafe_allow_html=True)
     st.markdown("<div class='card'><b>⚡ Performance</b><br>Responsive uploads and retrieval.</div>", unsafe_allow_html=True)
+    with st.expander("Password hashing"):
+        st.json(password_stats())
 
 st.markdown("---")
 st.markdown("#### Key Performance Metrics")
-mc1, mc2, mc3, mc4 = st.columns(4)
-with mc1:
-    st.markdown("<div class='metric-card'><div class='metric-value'>99.9%</div><div class='metric-label'>System Uptime</div></div>", unsafe_allow_html=True)
-with mc2:
-    st.markdown("<div class='metric-card'><div class='metric-value'>&lt;30s</div><div class='metric-label'>Upload Time</div></div>", unsafe_allow_html=True)
-with mc3:
-    st.markdown("<div class='metric-card'><div class='metric-value'>95%</div><div class='metric-label'>Format Support</div></div>", unsafe_allow_html=True)
-with mc4:
-    st.markdown("<div class='metric-card'><div class='metric-value'>100%</div><div class='metric-label'>Text Extraction</div></div>", unsafe_allow_html=True)
-
+st.caption(
+    f"Live from this server process · up {fmt_duration(time.time() - metrics.PROCESS_START)}"
+)
+login_hist = metrics.REGISTRY.get("login_seconds")
+logins = metrics.REGISTRY.total("login_attempts_total")
+login_failed = logins - metrics.REGISTRY.get("login_attempts_total", outcome="success").value
+upload_hist = metrics.REGISTRY.get("upload_extract_seconds", cache="miss")
+uploads = metrics.REGISTRY.get("upload_files_total").value  # distinct files, not reruns
+upload_errors = metrics.REGISTRY.get("upload_errors_total").value
+upload_bytes = metrics.REGISTRY.get("upload_bytes_total", cache="miss").value
+list_hist = metrics.REGISTRY.get("document_list_seconds")
+
+# Chatbot inference runs in the chatbot app's own process; it exports its
+# metrics (METRICS_PORT) and shows them in its sidebar
+mc1, mc2, mc3 = st.columns(3)
+metric_card(
+    mc1,
+    latency_pair(login_hist),
+    "Sign-in p50 / p95",
+    f"{int(logins)} attempts · {rate(login_failed, logins)} failed",
+)
+metric_card(
+    mc2,
+    latency_pair(upload_hist),
+    "Upload extraction p50 / p95",
+    f"{int(uploads)} files · {throughput(upload_bytes, upload_hist.sum)} · {rate(upload_errors, uploads + upload_errors)} errors",
+)
+metric_card(
+    mc3,
+    latency_pair(list_hist),
+    "Library listing p50 / p95",
+    f"{list_hist.count} page loads",
+)
+with st.expander("All metrics (Prometheus text format)"):
+    exposition = metrics.render_prometheus()
+    st.download_button("Download", exposition, file_name="metrics.prom", mime="text/plain")
+    st.code(exposition, language="text")
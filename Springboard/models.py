@@ -1,31 +1,206 @@
-!pip install sqlalchemy
+# models.py
+# -------------------------------------------------------------
+# User model and data access for the unified user store (SQLAlchemy)
+#
+# The tables match db.py, which owns the schema and its migrations
+# (PRAGMA user_version); simplifier.db and users.db are folded into the
+# same store with migrate_users.py.
+#
+# Importing this module only defines the model: the engine and its
+# connection pool are created on first use, not at import time. For SQLite
+# the first use also brings the file up to db.py's schema version by running
+# db.migrate(). create_all() never alters an existing table, so it is only
+# used for other databases.
+#
+# Configuration (environment variables):
+#   SIMPLIFIER_DATABASE_URL  database URL (default sqlite:///milestone1.db)
+#   SIMPLIFIER_SQL_ECHO      "1" to log every statement (default off)
+#   SIMPLIFIER_POOL_SIZE     pooled connections (default 5)
+#
+# Usage:
+#   with session_scope() as session:
+#       user = get_user_by_email(session, "a@b.com")
+# -------------------------------------------------------------
 
-from sqlalchemy import Column, Integer, String, DateTime, create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-import bcrypt
+from typing import Iterable, Iterator
+
+from sqlalchemy import Column, Index, Integer, LargeBinary, String, create_engine, event, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker, Session as OrmSession
+
+DATABASE_URL = os.environ.get("SIMPLIFIER_DATABASE_URL", "sqlite:///milestone1.db")
+SQL_ECHO = os.environ.get("SIMPLIFIER_SQL_ECHO", "0") == "1"
+POOL_SIZE = int(os.environ.get("SIMPLIFIER_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = 10
+POOL_TIMEOUT = 10  # seconds to wait for a pooled connection
+BULK_CHUNK_SIZE = 500  # rows per executemany / IN (...) lookup
+SCHEMA_VERSION = 2  # db.SCHEMA_VERSION this model maps
+
+# Same connection settings as the main app's db.py
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
 
 # Base class
 Base = declarative_base()
 
+
+def _utcnow() -> str:
+    return datetime.utcnow().isoformat()
+
 # ------------------ User Model ------------------
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     email = Column(String, unique=True, nullable=False)
-    password_hash = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    password_hash = Column(LargeBinary, nullable=False)  # bcrypt bytes, as in db.py
+    reset_token = Column(String)
+    created_at = Column(String, nullable=False, default=_utcnow)  # ISO-8601 text, as in db.py
+
+    __table_args__ = (
+        Index("idx_users_reset_token", "reset_token", sqlite_where=reset_token.isnot(None)),
+        {"sqlite_autoincrement": True},
+    )
 
     # Hash password
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = hash_password(password)
 
     # Verify password
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        import bcrypt
+
+        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash)
+
+
+def hash_password(password: str) -> bytes:
+    # bcrypt is only imported by code that actually hashes
+    import bcrypt
+
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+
 
 # ------------------ Database Setup ------------------
-engine = create_engine("sqlite:///simplifier.db", echo=True)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Scoped sessions: one session per thread (a Streamlit script run, a request
+# handler), bound to the engine when it is first created
+Session = scoped_session(sessionmaker(expire_on_commit=False))
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _migrate_sqlite(engine: Engine):
+    # db.py owns the schema: run its migrations when it is importable (the
+    # repository root on sys.path), otherwise refuse an outdated file clearly
+    # rather than failing later on a missing column
+    try:
+        import db
+    except ImportError:
+        db = None
+    path = engine.url.database
+    if db is not None:
+        if db.SCHEMA_VERSION != SCHEMA_VERSION:
+            raise RuntimeError(f"models.py maps schema v{SCHEMA_VERSION} but db.py is at v{db.SCHEMA_VERSION}.")
+        conn = db._connect(path)
+        try:
+            db.migrate(conn)
+        finally:
+            conn.close()
+        return
+    with engine.connect() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(
+            f"{path} is at schema v{version}, expected v{SCHEMA_VERSION}. "
+            "Run `python -c \"import db; db.init_db()\"` (or migrate_users.py) from the repository root first."
+        )
+
+
+def get_engine() -> Engine:
+    # Created once per process, on first use
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            kwargs = {"echo": SQL_ECHO, "pool_pre_ping": True}
+            if not DATABASE_URL.startswith("sqlite:///:memory:"):
+                kwargs.update(pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+            engine = create_engine(DATABASE_URL, **kwargs)
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", _set_sqlite_pragmas)
+                _migrate_sqlite(engine)
+            else:
+                Base.metadata.create_all(engine)
+            Session.configure(bind=engine)
+            _engine = engine
+    return _engine
+
+
+@contextmanager
+def session_scope() -> Iterator[OrmSession]:
+    # Commits on success, rolls back on error, and always releases the
+    # thread's session so its connection goes back to the pool
+    get_engine()
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+
+
+# ------------------ Helpers ------------------
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def get_user_by_email(session: OrmSession, email: str) -> User | None:
+    return session.execute(select(User).where(User.email == email.strip().lower())).scalar_one_or_none()
+
+
+def get_users_by_email(session: OrmSession, emails: Iterable[str]) -> dict[str, User]:
+    # One IN (...) query per chunk instead of one query per email
+    wanted = sorted({e.strip().lower() for e in emails})
+    found = {}
+    for chunk in _chunks(wanted):
+        for user in session.execute(select(User).where(User.email.in_(chunk))).scalars():
+            found[user.email] = user
+    return found
+
+
+def bulk_add_users(session: OrmSession, rows: Iterable[dict], skip_existing: bool = True) -> int:
+    # rows: {"email", "password_hash"[, "created_at"]}; passwords must already
+    # be hashed (hash_password). Inserted with executemany, bypassing the ORM
+    # unit of work. Returns the number of rows inserted.
+    now = _utcnow()
+    prepared = {}
+    for row in rows:
+        email = row["email"].strip().lower()
+        prepared[email] = {"email": email, "password_hash": row["password_hash"], "created_at": row.get("created_at", now)}
+    if skip_existing:
+        existing = get_users_by_email(session, prepared)
+        prepared = {email: row for email, row in prepared.items() if email not in existing}
+    values = list(prepared.values())
+    for chunk in _chunks(values):
+        session.execute(insert(User), chunk)
+    return len(values)
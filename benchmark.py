@@ -0,0 +1,413 @@
+# benchmark.py
+# -------------------------------------------------------------
+# Reproducible benchmarks for the intent engine and the data layer
+#
+# How to run:
+#   python benchmark.py                        # all suites, results in ./bench_results
+#   python benchmark.py --quick                # smaller sizes, for a smoke run
+#   python benchmark.py --only inference documents
+#   python benchmark.py --compare bench_results/<earlier>.json
+#
+# Suites:
+#   train      intent classifier training on intents.json
+#   inference  single-message engine latency (p50/p99), memo-hit latency and batched throughput
+#   documents  save_document / list_documents on synthetic libraries of
+#              growing size, in a throwaway database
+#   pdf        streaming text extraction on generated PDFs, cold and cached
+#
+# Every run writes one JSON file (environment + results) so runs can be
+# diffed; --compare prints the relative change of each timing against an
+# earlier file. Nothing here touches milestone1.db, ./models or the real
+# extraction cache.
+# -------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+SUITES = ("train", "inference", "documents", "pdf")
+RESULTS_DIR = "bench_results"
+
+FULL = {
+    "train_repeat": 3,
+    "single_requests": 2000,
+    "batch_sizes": (1, 32, 256, 1024),
+    "batch_messages": 8192,
+    "library_sizes": (100, 1000, 10000),
+    "list_queries": 200,
+    "pdf_pages": (8, 64, 256),
+}
+QUICK = {
+    "train_repeat": 1,
+    "single_requests": 200,
+    "batch_sizes": (1, 256),
+    "batch_messages": 1024,
+    "library_sizes": (100, 1000),
+    "list_queries": 50,
+    "pdf_pages": (8, 32),
+}
+
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def _percentiles(samples: list[float]) -> dict:
+    # Samples in seconds, reported in milliseconds
+    arr = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _environment() -> dict:
+    import sklearn
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def _messages(intents: list, n: int, rng: random.Random) -> list[str]:
+    # Real patterns, some lower-cased or with noise appended, so the mix
+    # includes both exact and unseen inputs
+    patterns = [p for intent in intents for p in intent["patterns"]]
+    out = []
+    for _ in range(n):
+        text = rng.choice(patterns)
+        r = rng.random()
+        if r < 0.3:
+            text = text.lower()
+        elif r < 0.5:
+            text = f"{text} {rng.choice(patterns)}"
+        out.append(text)
+    return out
+
+
+def make_pdf(n_pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    # Minimal valid PDF with one Helvetica text stream per page; `seed` changes
+    # the text so each generated file is a fresh extraction-cache key.
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page ids are known
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for p in range(n_pages):
+        lines = " ".join(
+            f"(Run {seed} page {p} line {i} lorem ipsum dolor sit amet) '" for i in range(lines_per_page)
+        )
+        text = f"BT /F1 10 Tf 40 800 Td 12 TL {lines} ET"
+        page_id = len(objects) + 1
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(text)} >>\nstream\n{text}\nendstream")
+        kids.append(page_id)
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += b"".join(f"{o:010d} 00000 n \n".encode("latin-1") for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+class _Upload(io.BytesIO):
+    # Stand-in for Streamlit's UploadedFile: a buffer with name and type
+    def __init__(self, data: bytes, name: str, mime: str):
+        super().__init__(data)
+        self.name = name
+        self.type = mime
+
+
+# ---------------------------
+# Suites
+# ---------------------------
+def bench_train(cfg: dict, intents_path: str) -> dict:
+    from intent_model import VECTORIZER_PARAMS, CLASSIFIER_PARAMS, train_model
+
+    with open(intents_path, "r", encoding="utf-8") as f:
+        intents = json.load(f)
+    samples = []
+    for _ in range(cfg["train_repeat"]):
+        start = time.perf_counter()
+        _, clf = train_model(intents, VECTORIZER_PARAMS, CLASSIFIER_PARAMS)
+        samples.append(time.perf_counter() - start)
+    return {
+        "patterns": sum(len(i["patterns"]) for i in intents),
+        "classes": len(clf.classes_),
+        "seconds": _percentiles(samples),
+    }
+
+
+def bench_inference(cfg: dict, intents_path: str, seed: int) -> dict:
+    from intent_model import load_model, predict, predict_batch
+
+    rng = random.Random(seed)
+    random.seed(seed)  # response choice
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        start = time.perf_counter()
+        model = load_model(intents_path, artifact_dir=artifact_dir)
+        cold_load = time.perf_counter() - start
+        start = time.perf_counter()
+        model = load_model(intents_path, artifact_dir=artifact_dir)
+        warm_load = time.perf_counter() - start
+
+    # Single messages, as get_chatbot_response serves them. The memo is
+    # cleared before every timed call so "single" always measures the engine;
+    # repeating the same message right after gives the memo-hit latency.
+    messages = _messages(model.intents, cfg["single_requests"], rng)
+    for text in messages[:20]:
+        predict(model, text)  # warm-up
+    samples = []
+    hit_samples = []
+    for text in messages:
+        model.memo.clear()
+        start = time.perf_counter()
+        predict(model, text)
+        samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        predict(model, text)
+        hit_samples.append(time.perf_counter() - start)
+    model.memo.clear()
+    single = _percentiles(samples)
+    single["throughput_per_s"] = len(samples) / sum(samples)
+    memo_hit = _percentiles(hit_samples)
+
+    batches = {}
+    messages = _messages(model.intents, cfg["batch_messages"], rng)
+    for size in cfg["batch_sizes"]:
+        samples = []
+        start_all = time.perf_counter()
+        for i in range(0, len(messages), size):
+            chunk = messages[i : i + size]
+            start = time.perf_counter()
+            for _ in predict_batch(model, chunk, chunk_size=size):
+                pass
+            samples.append(time.perf_counter() - start)
+        total = time.perf_counter() - start_all
+        batches[str(size)] = {**_percentiles(samples), "throughput_per_s": len(messages) / total}
+
+    return {
+        "load_cold_seconds": cold_load,
+        "load_warm_seconds": warm_load,
+        "single": single,
+        "single_memo_hit": memo_hit,
+        "batch": batches,
+    }
+
+
+def bench_documents(cfg: dict, seed: int) -> dict:
+    import db
+
+    rng = random.Random(seed)
+    words = "the quick brown fox jumps over lazy dog chatbot document summary intent model pdf".split()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_")
+    saved_path = db.DB_PATH
+    try:
+        results = {}
+        for size in cfg["library_sizes"]:
+            # A fresh database per size so every library starts empty
+            db.DB_PATH = os.path.join(tmp_dir, f"library_{size}.db")
+            db._pool = None
+            db.init_db()
+            with db.connection() as conn:
+                user_id = conn.execute(
+                    db.SQL_INSERT_USER, ("bench@example.com", b"x", datetime.utcnow().isoformat())
+                ).lastrowid
+
+            save_samples = []
+            for i in range(size):
+                body = " ".join(rng.choice(words) for _ in range(rng.randint(200, 1200)))
+                content = f"Document {i}\n{body}"
+                start = time.perf_counter()
+                db.save_document(user_id, content, f"doc_{i}.txt", "text/plain")
+                save_samples.append(time.perf_counter() - start)
+
+            # Re-saving an existing document takes the dedupe path
+            dup_samples = []
+            for _ in range(min(size, 200)):
+                content = db.get_document(rng.randint(1, size), user_id)["content"]
+                start = time.perf_counter()
+                db.save_document(user_id, content, "dup.txt", "text/plain")
+                dup_samples.append(time.perf_counter() - start)
+
+            page_samples, deep_samples = [], []
+            for _ in range(cfg["list_queries"]):
+                start = time.perf_counter()
+                db.list_documents(user_id, limit=20, offset=0)
+                page_samples.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                db.list_documents(user_id, limit=20, offset=max(0, size - 20))
+                deep_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            rows = db.list_documents(user_id)
+            list_all = time.perf_counter() - start
+
+            results[str(size)] = {
+                "save": _percentiles(save_samples),
+                "save_duplicate": _percentiles(dup_samples),
+                "list_first_page": _percentiles(page_samples),
+                "list_last_page": _percentiles(deep_samples),
+                "list_all_seconds": list_all,
+                "rows": len(rows),
+                "db_bytes": os.path.getsize(db.DB_PATH),
+            }
+            db.get_pool().close()
+        return results
+    finally:
+        # Leave db pointing at the real database and skip the exit-time
+        # throttle save into the throwaway one
+        db.DB_PATH = saved_path
+        db._pool = None
+        db._throttle_loaded = False
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_pdf(cfg: dict, seed: int) -> dict:
+    import extraction
+
+    if extraction.PdfReader is None:
+        return {"skipped": "PyPDF2 not installed"}
+
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    saved_cache = extraction.CACHE_DIR
+    extraction.CACHE_DIR = cache_dir
+    try:
+        results = {}
+        for n_pages in cfg["pdf_pages"]:
+            data = make_pdf(n_pages, seed=seed)
+            name = f"bench_{n_pages}.pdf"
+
+            start = time.perf_counter()
+            extracted = extraction.extract_upload(_Upload(data, name, "application/pdf"))
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            again = extraction.extract_upload(_Upload(data, name, "application/pdf"))
+            warm = time.perf_counter() - start
+
+            results[str(n_pages)] = {
+                "bytes": len(data),
+                "chars": extracted.length,
+                "cold_seconds": cold,
+                "pages_per_s": n_pages / cold,
+                "cached_seconds": warm,
+                "cache_hit": again.cached,
+                "parallel": n_pages >= extraction.PARALLEL_MIN_PAGES and extraction.MAX_WORKERS >= 2,
+            }
+        return results
+    finally:
+        extraction.CACHE_DIR = saved_cache
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# ---------------------------
+# Comparison
+# ---------------------------
+def _flatten(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for key, value in d.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            out.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[path] = value
+    return out
+
+
+def compare(baseline: dict, current: dict) -> list[tuple[str, float, float, float]]:
+    # Timings only: (metric, baseline, current, relative change)
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        if not (key.endswith("_ms") or key.endswith("seconds") or key.endswith("_per_s")):
+            continue
+        if old[key]:
+            rows.append((key, old[key], new[key], (new[key] - old[key]) / old[key]))
+    return rows
+
+
+def run(suites, cfg: dict, intents_path: str, seed: int) -> dict:
+    results = {}
+    for suite in suites:
+        start = time.perf_counter()
+        if suite == "train":
+            results[suite] = bench_train(cfg, intents_path)
+        elif suite == "inference":
+            results[suite] = bench_inference(cfg, intents_path, seed)
+        elif suite == "documents":
+            results[suite] = bench_documents(cfg, seed)
+        elif suite == "pdf":
+            results[suite] = bench_pdf(cfg, seed)
+        print(f"{suite:<10} done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the intent engine and the data layer.")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a smoke run")
+    parser.add_argument("--intents", default="intents.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    cfg = QUICK if args.quick else FULL
+    report = {
+        "environment": _environment(),
+        "config": {"quick": args.quick, "seed": args.seed, **{k: list(v) if isinstance(v, tuple) else v for k, v in cfg.items()}},
+        "results": run(args.only, cfg, args.intents, args.seed),
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key, old, new, change in compare(baseline, report):
+            print(f"{key:<60} {old:>12.4f} -> {new:>12.4f}  {change:+.1%}")
@@ -0,0 +1,531 @@
+# chat_archive.py
+# -------------------------------------------------------------
+# Rotation and columnar archival for the conversation log
+#
+# chat_log.db only keeps recent turns. A background thread checks it every
+# ROTATE_INTERVAL seconds and moves turns out once the live table holds more
+# than MAX_LIVE_ROWS rows, or when they are older than MAX_LIVE_DAYS. Moved
+# turns are written as Parquet segments, one directory per month:
+#   chat_archive/month=2024-05/seg-000000001201-000000004800.parquet
+# and only then deleted from SQLite. The chunk is read and its segments are
+# written with no transaction open on chat_log.db, so chat turns keep being
+# committed meanwhile; the write lock is held just for the DELETE. Segments are
+# zstd-compressed. session_id and response are dictionary-encoded, because a
+# small set of canned responses repeats in every row. Old months are
+# compacted into one sorted file so a month is a single scan.
+#
+# ChatHistory reads live and archived turns together. latest() and
+# iter_latest() page by id exactly like ConversationStore, so the history
+# views can page past the rotation point; a page decodes only the id column
+# of a month plus the rows it returns. to_table() returns one Arrow table
+# for analytics. Month directories and column statistics let filters skip
+# whole files, and only the requested columns are decoded.
+#
+# Archived rows keep their ids. meta.archived_through in chat_log.db records
+# the last archived id, so a rotation interrupted before its delete
+# committed is redone cleanly.
+#
+# Rotation and compaction hold a write lock on chat_archive/.archive.lock (a
+# small SQLite file), so app processes sharing the archive never rewrite it
+# at the same time. Readers in other processes take no lock: they skip
+# segments a finished compaction has merged, and list again if a segment
+# disappears under them.
+#
+# How to run:
+#   python chat_archive.py rotate          # archive what is due now
+#   python chat_archive.py compact
+#   python chat_archive.py stats           # turns per month, top responses
+# -------------------------------------------------------------
+
+import os
+import glob
+import time
+import uuid
+import sqlite3
+import warnings
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from conversation_store import ConversationStore, DEFAULT_PAGE_SIZE, STORE_PATH, TIMESTAMP_FORMAT, get_store
+
+# Optional: without pyarrow the log is never rotated and history is live-only
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+ARCHIVE_DIR = os.environ.get("CHAT_ARCHIVE_DIR", "chat_archive")
+MAX_LIVE_ROWS = int(os.environ.get("CHAT_LOG_MAX_LIVE_ROWS", "50000"))
+MAX_LIVE_DAYS = float(os.environ.get("CHAT_LOG_MAX_LIVE_DAYS", "30"))
+ROTATE_INTERVAL = float(os.environ.get("CHAT_LOG_ROTATE_INTERVAL", "600"))  # seconds
+ROTATE_CHUNK_ROWS = 50_000  # turns archived per write transaction (bounds how long writers wait)
+COMPACT_MIN_SEGMENTS = 8  # the current month is compacted once it has this many
+ROW_GROUP_SIZE = 64_000
+COMPRESSION = "zstd"
+ARCHIVE_LOCK_FILE = ".archive.lock"
+ARCHIVE_LOCK_TIMEOUT = 60.0  # seconds to wait for a rotation or compaction in another process
+READ_ATTEMPTS = 3  # archive reads list the segments again if one vanishes mid-scan
+
+if pa is not None:
+    ARCHIVE_SCHEMA = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("session_id", pa.dictionary(pa.int32(), pa.string())),
+            ("user_input", pa.string()),
+            ("response", pa.dictionary(pa.int32(), pa.string())),
+            ("created_at", pa.timestamp("s")),
+        ]
+    )
+
+COLUMNS = ("id", "session_id", "user_input", "response", "created_at")
+
+# Serializes rotation, compaction and archive reads within the process, so a
+# reader never lists a month while its segments are being replaced
+_archive_lock = threading.RLock()
+
+
+@contextmanager
+def _archive_guard(archive_dir: str):
+    # _archive_lock plus BEGIN IMMEDIATE on the archive's lock file: one
+    # rotation or compaction at a time across processes
+    with _archive_lock:
+        os.makedirs(archive_dir, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(archive_dir, ARCHIVE_LOCK_FILE), timeout=ARCHIVE_LOCK_TIMEOUT)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def _month_dir(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f"month={month}")
+
+
+def _segment_ids(path: str) -> tuple[int, int]:
+    # seg-<first id>-<last id>.parquet
+    _, first, last = os.path.basename(path)[: -len(".parquet")].split("-")
+    return int(first), int(last)
+
+
+def _segments(archive_dir: str, month: str = "*") -> list[str]:
+    return sorted(glob.glob(os.path.join(_month_dir(archive_dir, month), "seg-*.parquet")))
+
+
+def _readable_segments(archive_dir: str, month: str) -> list[str]:
+    # A compaction writes the merged file before removing the segments it
+    # replaces; segments whose ids another segment of the month already
+    # covers are skipped so no row is read twice
+    paths, covered = [], 0
+    for path in sorted(_segments(archive_dir, month), key=lambda p: (_segment_ids(p)[0], -_segment_ids(p)[1])):
+        last = _segment_ids(path)[1]
+        if last > covered:
+            paths.append(path)
+            covered = last
+    return sorted(paths)
+
+
+def _retry_vanished(read):
+    # Another process may compact segments away between listing and reading
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            return read()
+        except FileNotFoundError:
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+
+
+def _months(archive_dir: str) -> list[str]:
+    # Newest first
+    dirs = glob.glob(os.path.join(archive_dir, "month=*"))
+    return sorted((os.path.basename(d).split("=", 1)[1] for d in dirs), reverse=True)
+
+
+def _to_table(rows) -> "pa.Table":
+    columns = list(zip(*rows)) if rows else [[] for _ in COLUMNS]
+    return pa.table(
+        {
+            "id": pa.array(columns[0], pa.int64()),
+            "session_id": pa.array(columns[1], pa.string()).dictionary_encode(),
+            "user_input": pa.array(columns[2], pa.string()),
+            "response": pa.array(columns[3], pa.string()).dictionary_encode(),
+            "created_at": pc.strptime(pa.array(columns[4], pa.string()), format=TIMESTAMP_FORMAT, unit="s"),
+        },
+        schema=ARCHIVE_SCHEMA,
+    )
+
+
+def _write_parquet(table: "pa.Table", path: str):
+    # Written under a unique dot-name, which segment listings ignore, then
+    # renamed into place
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    try:
+        pq.write_table(
+            table,
+            tmp_path,
+            compression=COMPRESSION,
+            use_dictionary=["session_id", "response"],
+            row_group_size=ROW_GROUP_SIZE,
+        )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# ---------------------------
+# Rotation
+# ---------------------------
+def _archived_through(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key='archived_through'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _rotation_cutoff(conn: sqlite3.Connection, max_rows: int, max_days: float) -> int:
+    # Largest id to archive: everything older than max_days, and everything
+    # but the newest max_rows turns
+    cutoff = 0
+    if max_days:
+        since = (datetime.now() - timedelta(days=max_days)).strftime(TIMESTAMP_FORMAT)
+        row = conn.execute("SELECT MAX(id) FROM turns WHERE created_at < ?", (since,)).fetchone()
+        cutoff = row[0] or 0
+    row = conn.execute("SELECT id FROM turns ORDER BY id DESC LIMIT 1 OFFSET ?", (max_rows,)).fetchone()
+    if row:
+        cutoff = max(cutoff, row[0])
+    return cutoff
+
+
+def rotate(
+    store_path: str = STORE_PATH,
+    archive_dir: str = ARCHIVE_DIR,
+    max_rows: int = MAX_LIVE_ROWS,
+    max_days: float = MAX_LIVE_DAYS,
+) -> int:
+    # Moves due turns into Parquet; returns how many were archived
+    if pa is None:
+        return 0
+    moved = 0
+    conn = sqlite3.connect(store_path, timeout=30)
+    try:
+        while True:
+            # The guard makes this the only rotation of the archive, so the
+            # mark cannot move until we commit; archived turns never change
+            with _archive_guard(archive_dir):
+                done = _archived_through(conn)
+                cutoff = _rotation_cutoff(conn, max_rows, max_days)
+                rows = conn.execute(
+                    "SELECT id, session_id, user_input, response, created_at FROM turns "
+                    "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                    (done, cutoff, ROTATE_CHUNK_ROWS),
+                ).fetchall()
+                if not rows:
+                    return moved
+                # Segments past the mark are left over from an interrupted rotation
+                for path in _segments(archive_dir):
+                    if _segment_ids(path)[0] > done:
+                        os.remove(path)
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault(row[4][:7], []).append(row)
+                written = []
+                for month, month_rows in by_month.items():
+                    path = os.path.join(
+                        _month_dir(archive_dir, month), f"seg-{month_rows[0][0]:012d}-{month_rows[-1][0]:012d}.parquet"
+                    )
+                    _write_parquet(_to_table(month_rows), path)
+                    written.append(path)
+                last = rows[-1][0]
+                # IMMEDIATE only for the delete, which commits together with
+                # the new archived_through mark
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if _archived_through(conn) != done:
+                        # Moved by a rotation outside the guard: drop ours and look again
+                        conn.rollback()
+                        for path in written:
+                            os.remove(path)
+                        continue
+                    conn.execute("DELETE FROM turns WHERE id > ? AND id <= ?", (done, last))
+                    conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('archived_through', ?)", (str(last),))
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            moved += len(rows)
+    finally:
+        conn.close()
+
+
+def compact(archive_dir: str = ARCHIVE_DIR, min_segments: int = COMPACT_MIN_SEGMENTS) -> int:
+    # Merges each finished month into one file (the current month once it has
+    # min_segments); returns how many months were rewritten
+    if pa is None:
+        return 0
+    current = datetime.now().strftime("%Y-%m")
+    rewritten = 0
+    with _archive_guard(archive_dir):
+        for month in _months(archive_dir):
+            paths = _segments(archive_dir, month)
+            if len(paths) < 2 or (month == current and len(paths) < min_segments):
+                continue
+            table = pa.concat_tables([pq.read_table(p, schema=ARCHIVE_SCHEMA) for p in paths])
+            table = table.unify_dictionaries().combine_chunks().sort_by("id")
+            first, last = _segment_ids(paths[0])[0], _segment_ids(paths[-1])[1]
+            merged = os.path.join(_month_dir(archive_dir, month), f"seg-{first:012d}-{last:012d}.parquet")
+            _write_parquet(table, merged)
+            for path in paths:
+                if path != merged:
+                    os.remove(path)
+            rewritten += 1
+    return rewritten
+
+
+_rotators = {}
+_rotators_lock = threading.Lock()
+
+
+def start_rotation(store: ConversationStore, archive_dir: str = ARCHIVE_DIR, interval: float = ROTATE_INTERVAL):
+    # Once per store per process, so Streamlit reruns calling this are no-ops
+    key = os.path.abspath(store.path)
+    with _rotators_lock:
+        if key in _rotators:
+            return _rotators[key]
+        if pa is None:
+            warnings.warn("pyarrow not installed; the conversation log will not be rotated. Run: pip install pyarrow")
+            _rotators[key] = None
+            return None
+
+        def run():
+            while True:
+                try:
+                    store.flush()
+                    if rotate(store.path, archive_dir):
+                        compact(archive_dir)
+                except Exception as e:
+                    warnings.warn(f"Conversation log rotation failed: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="chat-log-rotation", daemon=True)
+        thread.start()
+        _rotators[key] = thread
+        return thread
+
+
+# ---------------------------
+# Reading live + archived turns
+# ---------------------------
+def _filter(
+    before_id: int | None = None,
+    session_id: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    text: str | None = None,
+):
+    # Same filters as ConversationStore.latest, as an Arrow expression
+    conditions = []
+    if before_id is not None:
+        conditions.append(ds.field("id") < before_id)
+    if session_id is not None:
+        conditions.append(ds.field("session_id") == session_id)
+    if since:
+        conditions.append(ds.field("created_at") >= pa.scalar(_bound(since, "00:00:00"), pa.timestamp("s")))
+    if until:
+        conditions.append(ds.field("created_at") <= pa.scalar(_bound(until, "23:59:59"), pa.timestamp("s")))
+    if text:
+        conditions.append(
+            pc.match_substring(ds.field("user_input"), text, ignore_case=True)
+            | pc.match_substring(ds.field("response").cast(pa.string()), text, ignore_case=True)
+        )
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _bound(value: str, default_time: str) -> datetime:
+    # "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS", as accepted by the live store
+    return _parse_timestamp(value if len(value) > 10 else f"{value} {default_time}")
+
+
+def _month_in_range(month: str, since: str | None, until: str | None) -> bool:
+    return not ((since and month < since[:7]) or (until and month > until[:7]))
+
+
+def _rows(table: "pa.Table") -> list[dict]:
+    created = [v.strftime(TIMESTAMP_FORMAT) for v in table.column("created_at").to_pylist()]
+    rows = table.drop_columns(["created_at"]).to_pylist()
+    for row, value in zip(rows, created):
+        row["created_at"] = value
+    return rows
+
+
+class ChatHistory:
+    def __init__(self, store: ConversationStore, archive_dir: str = ARCHIVE_DIR):
+        self.store = store
+        self.archive_dir = archive_dir
+
+    def _archive(self, months: list[str], columns=None, **filters) -> "pa.Table | None":
+        def read():
+            paths = [p for month in months for p in _readable_segments(self.archive_dir, month)]
+            if not paths:
+                return None
+            dataset = ds.dataset(paths, schema=ARCHIVE_SCHEMA, format="parquet")
+            return dataset.to_table(columns=columns, filter=_filter(**filters))
+
+        return _retry_vanished(read)
+
+    def _latest_archived(self, month: str, limit: int, before_id: int | None, **filters) -> "pa.Table | None":
+        # Newest `limit` matching turns of one month, newest first: matching
+        # ids come from the id column alone, then only those rows are decoded
+        def read():
+            paths = _readable_segments(self.archive_dir, month)
+            if not paths:
+                return None
+            dataset = ds.dataset(paths, schema=ARCHIVE_SCHEMA, format="parquet")
+            ids = dataset.to_table(columns=["id"], filter=_filter(before_id=before_id, **filters)).column("id")
+            if not len(ids):
+                return None
+            ids = ids.take(pc.select_k_unstable(ids, k=limit, sort_keys=[("id", "descending")]))
+            low, high = pc.min_max(ids).values()
+            # The id range lets row-group statistics skip everything else
+            expression = (ds.field("id") >= low) & (ds.field("id") <= high) & ds.field("id").isin(ids)
+            return dataset.to_table(columns=list(COLUMNS), filter=expression).sort_by([("id", "descending")])
+
+        return _retry_vanished(read)
+
+    def latest(self, limit: int = DEFAULT_PAGE_SIZE, before_id: int | None = None, **filters) -> list:
+        # Newest first across the live table and the archive; same keyset
+        # paging as ConversationStore.latest
+        rows = list(self.store.latest(limit, before_id, **filters))
+        if len(rows) >= limit or pa is None:
+            return rows
+        # The archive only holds ids older than every live row
+        if rows:
+            before_id = rows[-1]["id"]
+        with _archive_lock:
+            for month in _months(self.archive_dir):
+                if not _month_in_range(month, filters.get("since"), filters.get("until")):
+                    continue
+                table = self._latest_archived(month, limit - len(rows), before_id, **filters)
+                if table is None or not table.num_rows:
+                    continue
+                rows.extend(_rows(table))
+                before_id = rows[-1]["id"]
+                if len(rows) >= limit:
+                    break
+        return rows
+
+    def iter_latest(self, page_size: int = DEFAULT_PAGE_SIZE, **filters) -> Iterator:
+        before_id = None
+        while True:
+            rows = self.latest(page_size, before_id, **filters)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            before_id = rows[-1]["id"]
+
+    def count(self) -> int:
+        # Archived counts come from Parquet footers; nothing is decoded
+        archived = 0
+        if pa is not None:
+            def read():
+                paths = [p for month in _months(self.archive_dir) for p in _readable_segments(self.archive_dir, month)]
+                return sum(pq.ParquetFile(p).metadata.num_rows for p in paths)
+
+            with _archive_lock:
+                archived = _retry_vanished(read)
+        return self.store.count() + archived
+
+    def to_table(self, columns: list[str] | None = None, **filters) -> "pa.Table":
+        # Everything matching the filters as one Arrow table, oldest first:
+        # archived months that fall outside since/until are never opened
+        columns = list(columns or COLUMNS)
+        since, until = filters.get("since"), filters.get("until")
+        with _archive_lock:
+            months = [m for m in _months(self.archive_dir) if _month_in_range(m, since, until)]
+            archived = self._archive(months, columns, **filters)
+        live = [tuple(row) for row in self.store.iter_latest(ROTATE_CHUNK_ROWS, **filters)]
+        live_table = _to_table(live[::-1]).select(columns)
+        if archived is None:
+            return live_table
+        return pa.concat_tables([archived, live_table]).unify_dictionaries()
+
+    def summary(self, top: int = 10) -> dict:
+        # Turns per month and the most frequent responses, from two columns
+        table = self.to_table(["created_at", "response"])
+        months = pc.strftime(table.column("created_at"), format="%Y-%m")
+        per_month = pa.table({"month": months}).group_by("month").aggregate([("month", "count")]).sort_by("month")
+        responses = pa.table({"response": table.column("response").cast(pa.string())})
+        counts = responses.group_by("response").aggregate([("response", "count")])
+        counts = counts.sort_by([("response_count", "descending")]).slice(0, top)
+        return {
+            "turns": table.num_rows,
+            "per_month": dict(zip(per_month.column("month").to_pylist(), per_month.column("month_count").to_pylist())),
+            "top_responses": list(zip(counts.column("response").to_pylist(), counts.column("response_count").to_pylist())),
+        }
+
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(store: ConversationStore | None = None, archive_dir: str = ARCHIVE_DIR) -> ChatHistory:
+    # Shared per store, with the rotation thread started alongside
+    store = store or get_store()
+    key = (os.path.abspath(store.path), os.path.abspath(archive_dir))
+    with _histories_lock:
+        history = _histories.get(key)
+        if history is None:
+            history = _histories[key] = ChatHistory(store, archive_dir)
+    start_rotation(store, archive_dir)
+    return history
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Conversation log rotation and archive.")
+    parser.add_argument("command", choices=("rotate", "compact", "stats"))
+    parser.add_argument("--db", default=STORE_PATH)
+    parser.add_argument("--archive", default=ARCHIVE_DIR)
+    parser.add_argument("--max-rows", type=int, default=MAX_LIVE_ROWS)
+    parser.add_argument("--max-days", type=float, default=MAX_LIVE_DAYS)
+    parser.add_argument("--vacuum", action="store_true", help="shrink chat_log.db after rotating")
+    args = parser.parse_args()
+    if pa is None:
+        raise SystemExit("pyarrow is required: pip install pyarrow")
+
+    if args.command == "rotate":
+        start = time.perf_counter()
+        n = rotate(args.db, args.archive, args.max_rows, args.max_days)
+        print(f"Archived {n} turns into {args.archive} in {time.perf_counter() - start:.2f}s")
+        if args.vacuum:
+            # Freed pages are otherwise reused by new turns rather than returned
+            conn = sqlite3.connect(args.db)
+            conn.execute("VACUUM")
+            conn.close()
+    elif args.command == "compact":
+        print(f"Compacted {compact(args.archive, min_segments=2)} months")
+    else:
+        store = ConversationStore(args.db)
+        start = time.perf_counter()
+        stats = ChatHistory(store, args.archive).summary()
+        store.close()
+        print(f"{stats['turns']} turns ({time.perf_counter() - start:.2f}s)")
+        for month, n in stats["per_month"].items():
+            print(f"  {month}: {n}")
+        print("Top responses:")
+        for response, n in stats["top_responses"]:
+            print(f"  {n:>7}  {response[:70]}")
@@ -1,100 +1,95 @@
 import os
 import json
 import datetime
-import csv
-import nltk
-import ssl
+import uuid
 import streamlit as st
 import random
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from intent_model import get_model_holder, predict
+from hot_reload import watch_intents
+from retrieval_engine import index_for_model
+from conversation_store import get_store
+from chat_archive import get_history
 
-# --- Step 1: Library and Data Setup ---
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
+# In-process metrics (inference, prediction memo, model reloads, chat log);
+# METRICS_PORT serves them on /metrics for this app's process
+import metrics
 
-nltk.data.path.append(os.path.abspath("nltk_data"))
-try:
-    if not os.path.exists(os.path.join(os.path.abspath("nltk_data"), 'tokenizers', 'punkt')):
-        nltk.download('punkt', download_dir=os.path.abspath("nltk_data"))
-except Exception as e:
-    st.error(f"NLTK punkt download failed: {e}")
-    st.stop()
+if os.environ.get("METRICS_PORT"):
+    metrics.start_http_server(int(os.environ["METRICS_PORT"]))
 
-# Load intents from the JSON file
+# --- Step 1: Library and Data Setup ---
+# The classifier tokenizes with its TF-IDF vectorizer, not NLTK, so no NLTK
+# resources are downloaded and startup needs no network access.
+
+# --- Step 2: Model Loading ---
+FALLBACK_TAG = "unknown"
+
+# Intent engine behind get_chatbot_response: "classifier" (TF-IDF +
+# LogisticRegression) or "retrieval" (tag of the most similar pattern, see
+# retrieval_engine.py). Selected with the CHATBOT_ENGINE environment variable.
+CHATBOT_ENGINE = os.environ.get("CHATBOT_ENGINE", "classifier")
+RETRIEVAL_MIN_SIMILARITY = 0.3  # below this, retrieval uses the fallback responses
+NO_MATCH_RESPONSES = ["Sorry, I didn't understand that. Could you rephrase?"]
+
+# The classifier is trained once by `python intent_model.py` and cached as a
+# fingerprinted artifact; it is only retrained when intents.json or the
+# hyperparameters change. The holder is shared by every session and rerun in
+# this process, so the artifact is loaded once, not on each interaction.
 file_path = os.path.abspath("./intents.json")
+model_holder = get_model_holder(file_path, fallback_tag=FALLBACK_TAG)
 try:
-    with open(file_path, "r") as file:
-        intents = json.load(file)
+    model_holder.get()
 except FileNotFoundError:
     st.error(f"Error: intents.json not found at {file_path}")
     st.stop()
 except json.JSONDecodeError:
     st.error(f"Error: Could not decode intents.json. Please check its format.")
     st.stop()
-
-# --- Step 2: Model Training ---
-vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
-clf = LogisticRegression(random_state=0, max_iter=10000, solver='liblinear')
-
-# Preprocess the data
-tags = []
-patterns = []
-for intent in intents:
-    for pattern in intent['patterns']:
-        tags.append(intent['tag'])
-        patterns.append(pattern)
-
-# Training the model
-if len(patterns) > 0 and len(tags) > 0:
-    x = vectorizer.fit_transform(patterns)
-    y = tags
-    clf.fit(x, y)
-else:
-    st.error("Error: No patterns found in intents.json. Please populate the file.")
+except ValueError as e:
+    st.error(f"Error: {e}")
     st.stop()
 
+# Edits to intents.json are picked up without a restart: the model is rebuilt
+# incrementally and swapped in while sessions keep chatting
+watch_intents(model_holder, file_path)
+
 # --- Step 3: Enhanced Chatbot Functionality ---
 def get_chatbot_response(input_text):
     if not input_text:
         return random.choice(["Please enter a message.", "What can I help you with?"])
     
-    input_text_vec = vectorizer.transform([input_text])
-    
-    # Get prediction and confidence score
-    probabilities = clf.predict_proba(input_text_vec)[0]
-    max_prob = np.max(probabilities)
-    predicted_tag = clf.classes_[np.argmax(probabilities)]
-    
-    # Confidence threshold for better responses
-    confidence_threshold = 0.5 
-    
-    # If confidence is below threshold, use a fallback 'unknown' tag
-    if max_prob < confidence_threshold:
-        fallback_tag = 'unknown' 
-        for intent in intents:
-            if intent['tag'] == fallback_tag:
-                return random.choice(intent['responses'])
-    
-    # Otherwise, use the predicted tag
-    for intent in intents:
-        if intent['tag'] == predicted_tag:
-            return random.choice(intent['responses'])
-
-    # Fallback if the tag is not found for some reason
-    return "I'm sorry, I seem to be having a bit of trouble. Please try again."
+    model = model_holder.get()
+    if CHATBOT_ENGINE == "retrieval":
+        index = index_for_model(model)
+        match = index.best(input_text)
+        if match is None or match.similarity < RETRIEVAL_MIN_SIMILARITY:
+            # No pattern shares a term with the input, or none is close enough
+            if model.fallback_responses:
+                return random.choice(model.fallback_responses)
+            return random.choice(NO_MATCH_RESPONSES)
+        return random.choice(index.responses_by_tag[match.tag])
+
+    # intent_model.predict applies the 0.5 confidence threshold and the
+    # fallback responses
+    return predict(model, input_text).response
 
 counter = 0
 
+# Conversation log (SQLite, shared by all sessions in this process); the old
+# chat_log.csv is imported into it the first time it is opened
+chat_store = get_store()
+# History reads span the live log and its Parquet archive; old turns are
+# rotated out of chat_log.db in the background
+chat_history = get_history(chat_store)
+HISTORY_PAGE_SIZES = [10, 25, 50, 100]
+
 # --- Step 4: Streamlit Web Interface ---
 def main():
     global counter
     
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    
     st.set_page_config(page_title="Intents of Chatbot using NLP", layout="wide")
 
     page_bg_img = """
@@ -110,15 +105,31 @@ background-image: none;
     
     menu = ["Home", "Conversation History", "About"]
     choice = st.sidebar.selectbox("Menu", menu)
+    memo = model_holder.get().memo.stats()
+    if memo["hits"] + memo["misses"]:
+        st.sidebar.caption(f"Prediction memo: {memo['hit_rate']:.0%} hits · {memo['size']} utterances cached")
+    reload_info = model_holder.last_reload
+    if reload_info:
+        if reload_info["error"]:
+            st.sidebar.warning(f"intents.json reload failed; still serving the previous model. {reload_info['error']}")
+        else:
+            st.sidebar.caption(
+                f"Model reloaded ({reload_info['mode']}) in {reload_info['seconds'] * 1000:.0f} ms "
+                f"at {datetime.datetime.fromtimestamp(reload_info['at']).strftime('%H:%M:%S')}"
+            )
+    inference_hist = metrics.REGISTRY.get("inference_seconds")
+    if inference_hist is not None and inference_hist.count:
+        p50, p95 = inference_hist.quantile(0.50), inference_hist.quantile(0.95)
+        st.sidebar.caption(
+            f"Inference p50 / p95: {p50 * 1000:.2f} / {p95 * 1000:.2f} ms · "
+            f"{int(metrics.REGISTRY.total('inference_messages_total'))} messages"
+        )
+    with st.sidebar.expander("Metrics"):
+        st.code(metrics.render_prometheus(), language="text")
 
     if choice == "Home":
         st.write("Welcome to the chatbot. Please type a message to start the conversation.")
 
-        if not os.path.exists('chat_log.csv'):
-            with open('chat_log.csv', 'w', newline='', encoding='utf-8') as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerow(['User Input', 'Chatbot Response', 'Timestamp'])
-
         counter += 1
         user_input = st.text_input("You:", key=f"user_input_{counter}")
 
@@ -129,9 +140,7 @@ background-image: none;
             st.text_area("Chatbot:", value=response, height=120, max_chars=None, key=f"chatbot_response_{counter}")
             
             timestamp = datetime.datetime.now().strftime(f"%Y-%m-%d %H:%M:%S")
-            with open('chat_log.csv', 'a', newline='', encoding='utf-8') as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerow([user_input_str, response, timestamp])
+            chat_store.append(user_input_str, response, st.session_state.session_id, timestamp)
 
             if response.lower() in ['goodbye', 'bye', 'take care']:
                 st.write("Thank you for chatting with me. Have a great day!")
@@ -141,25 +150,47 @@ background-image: none;
 
     elif choice == "Conversation History":
         st.header("Conversation History 📖")
-        if not os.path.exists('chat_log.csv'):
+        # One page of the log is fetched per run with a keyset cursor, so the
+        # rendering cost depends on the page size, not on the size of the log
+        f1, f2, f3 = st.columns([0.45, 0.4, 0.15])
+        text_filter = f1.text_input("Search", key="history_text")
+        date_range = f2.date_input("Date range", value=(), key="history_dates")
+        page_size = f3.selectbox("Per page", HISTORY_PAGE_SIZES, index=1, key="history_page_size")
+
+        filters = {"text": text_filter.strip() or None}
+        if len(date_range) >= 1:
+            filters["since"] = date_range[0].strftime("%Y-%m-%d")
+        if len(date_range) == 2:
+            filters["until"] = date_range[1].strftime("%Y-%m-%d") + " 23:59:59"
+
+        # Start again from the newest page whenever the filters change
+        cursor_key = (tuple(sorted(filters.items())), page_size)
+        if st.session_state.get("history_cursor_key") != cursor_key:
+            st.session_state.history_cursor_key = cursor_key
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+
+        rows = chat_history.latest(page_size + 1, cursors[-1], **filters)
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if not rows:
             st.info("No conversation history found.")
         else:
-            with open('chat_log.csv', 'r', encoding='utf-8') as csvfile:
-                csv_reader = csv.reader(csvfile)
-                try:
-                    header = next(csv_reader)
-                    rows = list(csv_reader)
-                    if not rows:
-                        st.info("No conversation history found.")
-                    else:
-                        for row in reversed(rows):
-                            if len(row) >= 3:
-                                st.text(f"User: {row[0]}")
-                                st.text(f"Chatbot: {row[1]}")
-                                st.text(f"Timestamp: {row[2]}")
-                                st.markdown("---")
-                except StopIteration:
-                    st.info("No conversation history found.")
+            for row in rows:
+                st.text(f"User: {row['user_input']}")
+                st.text(f"Chatbot: {row['response']}")
+                st.text(f"Timestamp: {row['created_at']}")
+                st.markdown("---")
+
+            st.caption(f"Page {len(cursors)}")
+            newer_col, older_col, _ = st.columns([0.15, 0.15, 0.7])
+            if newer_col.button("← Newer", key="history_newer", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+            if older_col.button("Older →", key="history_older", disabled=not has_older):
+                cursors.append(rows[-1]["id"])
+                st.rerun()
 
 
     elif choice == "About":
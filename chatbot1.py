@@ -1,21 +1,11 @@
 from IPython import get_ipython
 from IPython.display import display
 
-import nltk
-
-import os
-import nltk
-import ssl
-
 import streamlit as st
 import random
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 
-ssl._create_default_https_context = ssl._create_unverified_context
-nltk.data.path.append(os.path.abspath("nltk_data"))
-nltk.download('punkt')
-
 intents = [
     {
         "tag": "greeting",
@@ -0,0 +1,419 @@
+# conversation_store.py
+# -------------------------------------------------------------
+# Append-optimized conversation log backed by SQLite
+#
+# Chat turns are written behind the request: append() only puts the turn on
+# a bounded queue, and a background writer thread drains it in batches (one
+# transaction per batch) once batch_size turns are waiting or flush_interval
+# seconds have passed. When the queue is full append() blocks - backpressure
+# instead of unbounded memory - for at most enqueue_timeout seconds, after
+# which the turn is dropped and counted. Reads call flush() first so they see
+# every turn appended before them: it queues its own marker and waits only for
+# the turns ahead of it, and returns at once when nothing is waiting. The
+# queue is drained at shutdown. A batch that fails with a locked or busy
+# database is retried with backoff before its turns are counted as dropped.
+#
+# The table is indexed by timestamp and by session so history pages are
+# keyset reads of the newest rows instead of a scan of the log.
+#
+# Durability (environment variables):
+#   CHAT_LOG_SYNCHRONOUS     SQLite synchronous mode: OFF, NORMAL (default) or
+#                            FULL (fsync on every batch commit)
+#   CHAT_LOG_BATCH_SIZE      turns per transaction (default 32)
+#   CHAT_LOG_FLUSH_INTERVAL  max seconds a turn waits in memory (default 2)
+#   CHAT_LOG_QUEUE_SIZE      turns that may be waiting (default 1024)
+#   CHAT_LOG_WRITE_BEHIND    "0" writes every turn before append() returns
+#
+# One-time import of the old CSV log:
+#   python conversation_store.py import chat_log.csv
+# -------------------------------------------------------------
+
+import os
+import csv
+import time
+import queue
+import atexit
+import sqlite3
+import warnings
+import threading
+from datetime import datetime
+from typing import Iterator
+
+import metrics
+
+STORE_PATH = "chat_log.db"
+LEGACY_CSV_PATH = "chat_log.csv"
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Formats found in chat_log.csv, newest first
+LEGACY_TIMESTAMP_FORMATS = (TIMESTAMP_FORMAT, "%d-%m-%Y %H:%M", "%d-%m-%Y %H:%M:%S")
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("CHAT_LOG_BATCH_SIZE", "32"))
+DEFAULT_FLUSH_INTERVAL = float(os.environ.get("CHAT_LOG_FLUSH_INTERVAL", "2.0"))  # seconds
+DEFAULT_QUEUE_SIZE = int(os.environ.get("CHAT_LOG_QUEUE_SIZE", "1024"))
+DEFAULT_SYNCHRONOUS = os.environ.get("CHAT_LOG_SYNCHRONOUS", "NORMAL").upper()
+DEFAULT_WRITE_BEHIND = os.environ.get("CHAT_LOG_WRITE_BEHIND", "1") != "0"
+DEFAULT_ENQUEUE_TIMEOUT = 5.0  # seconds append() may block on a full queue
+WRITE_ATTEMPTS = 5  # tries per batch before its turns are dropped
+WRITE_RETRY_DELAY = 0.1  # seconds before the first retry, doubled after each
+DEFAULT_PAGE_SIZE = 50
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL")
+BUSY_TIMEOUT = 5.0  # seconds
+
+SQL_INSERT_TURN = "INSERT INTO turns(session_id, user_input, response, created_at) VALUES(?,?,?,?)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_input TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_turns_created_at ON turns(created_at);
+CREATE INDEX IF NOT EXISTS idx_turns_session ON turns(session_id, id);
+CREATE TABLE IF NOT EXISTS meta(
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def now_timestamp() -> str:
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def normalize_timestamp(value: str) -> str:
+    value = (value or "").strip()
+    for fmt in LEGACY_TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized timestamp: {value!r}")
+
+
+WRITE_SECONDS = metrics.histogram("chat_log_write_seconds", "Time to commit one batch of chat turns.")
+TURNS_WRITTEN = metrics.counter("chat_log_turns_written_total", "Chat turns committed to the log.")
+TURNS_DROPPED = metrics.counter("chat_log_turns_dropped_total", "Chat turns lost to a full queue or a failed write.")
+ENQUEUE_WAITS = metrics.counter("chat_log_enqueue_waits_total", "append() calls that found the queue full.")
+WRITE_RETRIES = metrics.counter("chat_log_write_retries_total", "Batch writes retried after a locked or busy database.")
+
+
+class _Flush:
+    # Queue marker for one flush() call, set once every turn ahead of it is written
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+def _read_legacy_csv(csv_path: str, session_id: str) -> tuple[list, int]:
+    # (rows, skipped): short rows and unparseable timestamps are skipped
+    rows, skipped = [], 0
+    with open(csv_path, "r", encoding="utf-8", newline="") as csvfile:
+        csv_reader = csv.reader(csvfile)
+        next(csv_reader, None)  # header row
+        for row in csv_reader:
+            try:
+                rows.append((session_id, row[0], row[1], normalize_timestamp(row[2])))
+            except (IndexError, ValueError):
+                skipped += 1
+    return rows, skipped
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        path: str = STORE_PATH,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        synchronous: str = DEFAULT_SYNCHRONOUS,
+        write_behind: bool = DEFAULT_WRITE_BEHIND,
+        enqueue_timeout: float | None = DEFAULT_ENQUEUE_TIMEOUT,
+    ):
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}, not {synchronous!r}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.write_behind = write_behind
+        self.enqueue_timeout = enqueue_timeout
+        self._lock = threading.Lock()  # guards the reader connection
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        # The writer thread has its own connection, so in WAL mode reads never
+        # wait for a batch being committed
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Turns queued and turns the writer has finished with (written or
+        # dropped); flush() has nothing to wait for while they are equal
+        self._seq_lock = threading.Lock()
+        self._queued = 0
+        self._finished = 0
+        self._writer = None
+        if write_behind:
+            self._writer = threading.Thread(target=self._run_writer, name="chat-log-writer", daemon=True)
+            self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+    def append(self, user_input: str, response: str, session_id: str, created_at: str | None = None):
+        row = (session_id, user_input, response, created_at or now_timestamp())
+        if self._writer is None:
+            with self._lock:
+                self._write_batch(self._conn, [row])
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            ENQUEUE_WAITS.inc()
+            try:
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            except queue.Full:
+                TURNS_DROPPED.inc()
+                warnings.warn("Chat log queue is full; dropping a turn.")
+                return
+        with self._seq_lock:
+            self._queued += 1
+
+    def flush(self):
+        # Blocks until every turn appended before the call is committed; turns
+        # appended after it, by any session, are not waited for
+        if self._writer is None or not self._writer.is_alive():
+            return
+        with self._seq_lock:
+            if self._finished >= self._queued:
+                return
+        marker = _Flush()
+        self._queue.put(marker)
+        marker.done.wait()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _write_batch(self, conn: sqlite3.Connection, rows: list):
+        if not rows:
+            return
+        delay = WRITE_RETRY_DELAY
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with WRITE_SECONDS.time(), conn:
+                    conn.executemany(SQL_INSERT_TURN, rows)
+                TURNS_WRITTEN.inc(len(rows))
+                return
+            except sqlite3.OperationalError as e:
+                # Locked or busy past the busy timeout: back off and retry
+                error = e
+                if attempt == WRITE_ATTEMPTS:
+                    break
+                WRITE_RETRIES.inc()
+                time.sleep(delay)
+                delay *= 2
+            except sqlite3.Error as e:
+                error = e
+                break
+        TURNS_DROPPED.inc(len(rows))
+        warnings.warn(f"Could not write {len(rows)} chat turns to {self.path}: {error}")
+
+    def _finish(self, conn: sqlite3.Connection, batch: list):
+        self._write_batch(conn, batch)
+        with self._seq_lock:
+            self._finished += len(batch)
+
+    def _run_writer(self):
+        conn = self._connect()
+        batch = []
+        deadline = None  # flush_interval after the oldest turn in the batch
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # The oldest waiting turn is due
+                self._finish(conn, batch)
+                batch, deadline = [], None
+                continue
+            if isinstance(item, _Flush) or item is _STOP:
+                # Every turn queued ahead of the marker is in this batch
+                self._finish(conn, batch)
+                batch, deadline = [], None
+                if item is _STOP:
+                    conn.close()
+                    return
+                item.done.set()
+            else:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) >= self.batch_size:
+                    self._finish(conn, batch)
+                    batch, deadline = [], None
+
+    def close(self):
+        # Drains the queue, stops the writer and closes both connections
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+    def latest(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        before_id: int | None = None,
+        session_id: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        text: str | None = None,
+    ):
+        # Keyset pagination: pass the smallest id of the previous page as before_id.
+        # since/until are inclusive created_at bounds ("YYYY-MM-DD[ HH:MM:SS]");
+        # text is a case-insensitive substring of the user input or the response.
+        self.flush()
+        clauses, params = [], []
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        if session_id is not None:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        if text:
+            pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(user_input LIKE ? ESCAPE '\\' OR response LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT id, session_id, user_input, response, created_at FROM turns {where} "
+                "ORDER BY id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+
+    def iter_latest(self, page_size: int = DEFAULT_PAGE_SIZE, **filters) -> Iterator[sqlite3.Row]:
+        before_id = None
+        while True:
+            rows = self.latest(page_size, before_id, **filters)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            before_id = rows[-1]["id"]
+
+    def count(self) -> int:
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+    # ---------------------------
+    # Legacy CSV import
+    # ---------------------------
+    def _csv_imported(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key='csv_imported'").fetchone() is not None
+
+    def import_csv(self, csv_path: str = LEGACY_CSV_PATH, session_id: str = "legacy-csv", force: bool = False) -> int:
+        # Cheap check first: once imported, the CSV is never read again
+        if not force and self._csv_imported():
+            return 0
+        rows, skipped = _read_legacy_csv(csv_path, session_id)
+        if skipped:
+            warnings.warn(f"Skipped {skipped} malformed rows in {csv_path}.")
+        self.flush()
+        with self._lock:
+            # BEGIN IMMEDIATE so two processes starting together import only once
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = self._conn.execute("SELECT 1 FROM meta WHERE key='csv_imported'").fetchone()
+                if done and not force:
+                    self._conn.rollback()
+                    return 0
+                self._conn.executemany(SQL_INSERT_TURN, rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES('csv_imported', ?)",
+                    (os.path.abspath(csv_path),),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return len(rows)
+
+    def import_csv_once(self, csv_path: str = LEGACY_CSV_PATH) -> int:
+        if not os.path.exists(csv_path):
+            return 0
+        return self.import_csv(csv_path)
+
+
+
+# One store per database file per process, shared across Streamlit reruns
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: str = STORE_PATH) -> ConversationStore:
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ConversationStore(path)
+            store.import_csv_once(os.path.join(os.path.dirname(key), LEGACY_CSV_PATH))
+            _stores[key] = store
+        return store
+
+
+def _collect_metrics():
+    for key, store in list(_stores.items()):
+        yield "chat_log_queue_depth", "Chat turns waiting for the background writer.", {"path": key}, store.pending()
+
+
+metrics.register_collector(_collect_metrics)
+
+
+@atexit.register
+def _close_all():
+    # Drains every writer queue before the interpreter exits
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        try:
+            store.close()
+        except sqlite3.Error:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Conversation store maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="import a legacy chat_log.csv")
+    p_import.add_argument("csv_path", nargs="?", default=LEGACY_CSV_PATH)
+    p_import.add_argument("--db", default=STORE_PATH)
+    p_import.add_argument("--force", action="store_true", help="import even if a CSV was imported before")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store = ConversationStore(args.db)
+        n = store.import_csv(args.csv_path, force=args.force)
+        store.close()
+        print(f"Imported {n} turns from {args.csv_path} into {args.db}")
@@ -0,0 +1,619 @@
+# db.py
+# -------------------------------------------------------------
+# Data-access layer for milestone1.db
+#
+# All helpers borrow a connection from a small thread-safe pool instead of
+# opening a fresh sqlite3 connection per statement. Connections run in WAL
+# mode with a busy timeout, so concurrent Streamlit sessions can read while
+# one of them writes instead of failing with "database is locked".
+# Statements are module-level constants; sqlite3 keeps compiled statements
+# per connection (cached_statements), so pooled connections reuse them.
+# -------------------------------------------------------------
+
+import re
+import time
+import queue
+import atexit
+import hashlib
+import sqlite3
+import secrets
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+from passwords import hash_password, check_password, needs_rehash, PasswordHasherBusy
+from rate_limit import TokenBucketLimiter
+
+DB_PATH = "milestone1.db"
+
+POOL_SIZE = 8
+POOL_TIMEOUT = 10.0  # seconds to wait for a free connection
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 64
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache per connection
+)
+
+
+# ---------------------------
+# Connection pool
+# ---------------------------
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = _connect(self.path)
+                self._created += 1
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection.") from None
+
+    @contextmanager
+    def connection(self):
+        # Commits on success and rolls back on error before returning the
+        # connection to the pool, so a borrowed connection is always clean.
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+# ---------------------------
+# Schema
+# ---------------------------
+CREATE_USERS = """
+CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    password_hash BLOB NOT NULL,
+    reset_token TEXT,
+    created_at TEXT NOT NULL
+);
+"""
+
+CREATE_DOCUMENTS = """
+CREATE TABLE IF NOT EXISTS documents(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    filename TEXT,
+    mime TEXT,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    preview TEXT,
+    length INTEGER,
+    content_hash TEXT,
+    FOREIGN KEY(user_id) REFERENCES users(id)
+);
+"""
+
+CREATE_DOCUMENTS_HASH_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_documents_user_hash ON documents(user_id, content_hash)"
+)
+
+# Full-text index over documents (external content: the text is stored once,
+# in documents; triggers keep the index in sync with every insert/delete).
+CREATE_DOCUMENTS_FTS = """
+CREATE VIRTUAL TABLE documents_fts USING fts5(
+    filename, content, content='documents', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+CREATE_DOCUMENTS_FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, filename, content) VALUES (new.id, new.filename, new.content);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, content)
+        VALUES ('delete', old.id, old.filename, old.content);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF filename, content ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, content)
+        VALUES ('delete', old.id, old.filename, old.content);
+        INSERT INTO documents_fts(rowid, filename, content) VALUES (new.id, new.filename, new.content);
+    END;
+    """,
+)
+
+CREATE_LOGIN_THROTTLE = """
+CREATE TABLE IF NOT EXISTS login_throttle(
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY(scope, key)
+);
+"""
+
+PREVIEW_CHARS = 280
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# ---------------------------
+# Migrations
+# ---------------------------
+# The schema version lives in PRAGMA user_version. Each migration runs once,
+# in order, in the same transaction as the version bump, so a database is
+# never left half-migrated. Version 0 databases may be any of the older
+# hand-made layouts (milestone1.db without reset_token, users.db without
+# documents), so the first migration only adds what is missing.
+def _migrate_baseline(conn: sqlite3.Connection):
+    conn.execute(CREATE_USERS)
+    conn.execute(CREATE_DOCUMENTS)
+    # Databases created before password reset existed lack this column
+    _ensure_column(conn, "users", "reset_token", "TEXT")
+    # Document metadata used by the library view, backfilled for old rows
+    _ensure_column(conn, "documents", "preview", "TEXT")
+    _ensure_column(conn, "documents", "length", "INTEGER")
+    _ensure_column(conn, "documents", "content_hash", "TEXT")
+    conn.create_function("content_hash", 1, content_hash, deterministic=True)
+    conn.execute(
+        "UPDATE documents SET preview=substr(content, 1, ?), length=length(content), "
+        "content_hash=content_hash(content) WHERE content_hash IS NULL",
+        (PREVIEW_CHARS,),
+    )
+    conn.execute(CREATE_DOCUMENTS_HASH_INDEX)
+    _init_fts(conn)
+    conn.execute(CREATE_LOGIN_THROTTLE)
+
+
+def _migrate_indexes(conn: sqlite3.Connection):
+    # users.email is already an index seek through its UNIQUE constraint.
+    # Reset tokens are looked up by value when a reset link is used; only the
+    # few users with a pending reset are indexed.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_reset_token ON users(reset_token) WHERE reset_token IS NOT NULL"
+    )
+    # Per-user listing, newest first, walks this index (its implicit last
+    # column is the rowid); it also covers every lookup the old
+    # user_id-only index served.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_user_created ON documents(user_id, created_at)")
+    conn.execute("DROP INDEX IF EXISTS idx_documents_user")
+    conn.execute("ANALYZE")
+
+
+MIGRATIONS = (
+    _migrate_baseline,
+    _migrate_indexes,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> tuple[int, int]:
+    # Brings any database up to SCHEMA_VERSION; returns (from, to). An
+    # up-to-date database is only read: the write lock (BEGIN IMMEDIATE,
+    # which serializes processes starting up at the same time) is taken only
+    # when a migration is pending.
+    start = schema_version(conn)
+    if start > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError(f"Database schema version {start} is newer than this code ({SCHEMA_VERSION}).")
+    if start == SCHEMA_VERSION:
+        return start, SCHEMA_VERSION
+    if conn.in_transaction:
+        conn.commit()  # the version read above opened no write, but close it out
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have migrated while we waited for the lock
+        start = schema_version(conn)
+        for version in range(start, SCHEMA_VERSION):
+            MIGRATIONS[version](conn)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return start, SCHEMA_VERSION
+
+
+_initialized = set()  # database paths migrated by this process
+_init_lock = threading.Lock()
+
+
+def init_db():
+    # Once per database per process; Streamlit reruns calling this are no-ops
+    with _init_lock:
+        if DB_PATH in _initialized:
+            return
+        with connection() as conn:
+            migrate(conn)
+        _initialized.add(DB_PATH)
+    load_login_throttle()
+
+
+def _init_fts(conn: sqlite3.Connection):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='documents_fts'"
+    ).fetchone()
+    if not exists:
+        conn.execute(CREATE_DOCUMENTS_FTS)
+        # Index the documents that were saved before search existed
+        conn.execute("INSERT INTO documents_fts(documents_fts) VALUES('rebuild')")
+    for trigger in CREATE_DOCUMENTS_FTS_TRIGGERS:
+        conn.execute(trigger)
+
+
+# ---------------------------
+# Login throttling
+# ---------------------------
+# Token buckets checked before any bcrypt work: 5 attempts per email and 20
+# per browser session, refilling over 15 minutes. A successful login resets
+# the email's bucket. Both buckets must have a token before either is taken,
+# so attempts refused by the session limit leave the email's budget alone.
+# Every Streamlit process saves only the buckets it touched, reset or evicted
+# since its last save, so processes sharing the database keep each other's rows.
+LOGIN_WINDOW_SECONDS = 15 * 60
+THROTTLE_PERSIST_INTERVAL = 30.0  # seconds between saves to login_throttle
+
+login_limiters = {
+    "email": TokenBucketLimiter(5, 5 / LOGIN_WINDOW_SECONDS),
+    "session": TokenBucketLimiter(20, 20 / LOGIN_WINDOW_SECONDS),
+}
+_throttle_loaded = False
+_throttle_saved_at = time.monotonic()
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many sign-in attempts. Please try again in {int(retry_after) + 1} seconds.")
+        self.retry_after = retry_after
+
+
+def _throttle_login(email: str, session_id: str | None):
+    buckets = [(scope, key) for scope, key in (("session", session_id), ("email", email)) if key is not None]
+    for scope, key in buckets:
+        allowed, retry_after = login_limiters[scope].check(key)
+        if not allowed:
+            raise LoginThrottled(retry_after)
+    for scope, key in buckets:
+        allowed, retry_after = login_limiters[scope].try_acquire(key)
+        if not allowed:  # taken by a concurrent attempt since the check
+            raise LoginThrottled(retry_after)
+
+
+def load_login_throttle():
+    # Once per process: later calls would overwrite fresher in-memory state
+    global _throttle_loaded
+    if _throttle_loaded:
+        return
+    _throttle_loaded = True
+    with connection() as conn:
+        rows = conn.execute("SELECT scope, key, tokens, updated_at FROM login_throttle").fetchall()
+    for scope, limiter in login_limiters.items():
+        limiter.restore((r["key"], r["tokens"], r["updated_at"]) for r in rows if r["scope"] == scope)
+
+
+SQL_UPSERT_THROTTLE = (
+    "INSERT INTO login_throttle(scope, key, tokens, updated_at) VALUES(?,?,?,?) "
+    "ON CONFLICT(scope, key) DO UPDATE SET tokens=excluded.tokens, updated_at=excluded.updated_at "
+    "WHERE excluded.updated_at >= login_throttle.updated_at"
+)
+# A row another process updated after our reset or eviction is kept
+SQL_DELETE_THROTTLE = "DELETE FROM login_throttle WHERE scope=? AND key=? AND updated_at <= ?"
+SQL_DELETE_EXPIRED_THROTTLE = "DELETE FROM login_throttle WHERE scope=? AND updated_at < ?"
+
+
+def save_login_throttle():
+    global _throttle_saved_at
+    _throttle_saved_at = time.monotonic()
+    touched, removed = [], []
+    for scope, limiter in login_limiters.items():
+        changed, gone = limiter.changes()
+        touched.extend((scope, *row) for row in changed)
+        removed.extend((scope, key, updated_at) for key, updated_at in gone)
+    if not touched and not removed:
+        return
+    # Fully refilled buckets carry no information, whichever process wrote them
+    now = time.time()
+    expired = [(scope, now - limiter.ttl) for scope, limiter in login_limiters.items()]
+    with connection() as conn:
+        conn.executemany(SQL_UPSERT_THROTTLE, touched)
+        conn.executemany(SQL_DELETE_THROTTLE, removed)
+        conn.executemany(SQL_DELETE_EXPIRED_THROTTLE, expired)
+
+
+@atexit.register
+def _save_login_throttle_at_exit():
+    if _throttle_loaded:
+        try:
+            save_login_throttle()
+        except sqlite3.Error:
+            pass
+
+
+# ---------------------------
+# Users
+# ---------------------------
+SQL_INSERT_USER = "INSERT INTO users(email, password_hash, created_at) VALUES(?,?,?)"
+SQL_SELECT_USER_BY_EMAIL = "SELECT id, email, password_hash FROM users WHERE email=?"
+SQL_SET_RESET_TOKEN = "UPDATE users SET reset_token=? WHERE email=?"
+SQL_SELECT_RESET_TOKEN = "SELECT reset_token FROM users WHERE email=?"
+SQL_RESET_PASSWORD = "UPDATE users SET password_hash=?, reset_token=NULL WHERE email=?"
+SQL_UPDATE_PASSWORD_HASH = "UPDATE users SET password_hash=? WHERE id=? AND password_hash=?"
+
+
+def add_user(email: str, password: str) -> tuple[bool, str]:
+    if not email or not password:
+        return False, "Email and password are required."
+    try:
+        pw_hash = hash_password(password)
+        with connection() as conn:
+            conn.execute(SQL_INSERT_USER, (email.strip().lower(), pw_hash, datetime.utcnow().isoformat()))
+        return True, "Registration successful."
+    except sqlite3.IntegrityError:
+        return False, "Email already registered."
+    except Exception as e:
+        return False, f"Registration failed: {e}"
+
+
+LOGIN_SECONDS = metrics.histogram("login_seconds", "Time spent in verify_user.")
+LOGIN_OUTCOMES = {
+    outcome: metrics.counter("login_attempts_total", "Sign-in attempts by outcome.", outcome=outcome)
+    for outcome in ("success", "invalid", "throttled", "busy", "error")
+}
+
+
+def verify_user(email: str, password: str, session_id: str | None = None):
+    # Raises LoginThrottled when the email or session is over its limit
+    outcome = "error"
+    try:
+        with LOGIN_SECONDS.time():
+            user = _verify_user(email, password, session_id)
+        outcome = "success" if user else "invalid"
+        return user
+    except LoginThrottled:
+        outcome = "throttled"
+        raise
+    except PasswordHasherBusy:
+        outcome = "busy"
+        raise
+    finally:
+        LOGIN_OUTCOMES[outcome].inc()
+
+
+def _verify_user(email: str, password: str, session_id: str | None):
+    email = email.strip().lower()
+    try:
+        _throttle_login(email, session_id)
+    finally:
+        if time.monotonic() - _throttle_saved_at >= THROTTLE_PERSIST_INTERVAL:
+            save_login_throttle()
+
+    with connection() as conn:
+        row = conn.execute(SQL_SELECT_USER_BY_EMAIL, (email,)).fetchone()
+    if not row:
+        return None
+    try:
+        ok = check_password(password, row["password_hash"])
+    except ValueError:  # malformed stored hash
+        return None
+    if not ok:
+        return None
+    login_limiters["email"].reset(email)
+    # Hashes carry their bcrypt cost; upgrade old ones while we have the password
+    if needs_rehash(row["password_hash"]):
+        try:
+            new_hash = hash_password(password)
+        except PasswordHasherBusy:
+            new_hash = None  # try again on the next login
+        if new_hash is not None:
+            with connection() as conn:
+                conn.execute(SQL_UPDATE_PASSWORD_HASH, (new_hash, row["id"], row["password_hash"]))
+    return {"id": row["id"], "email": row["email"]}
+
+
+def create_reset_token(email: str) -> str | None:
+    token = secrets.token_hex(16)  # 32-char secure token
+    with connection() as conn:
+        cur = conn.execute(SQL_SET_RESET_TOKEN, (token, email.strip().lower()))
+        if cur.rowcount == 0:  # no matching email
+            return None
+    return token
+
+
+def reset_password(email: str, token: str, new_password: str) -> tuple[bool, str]:
+    with connection() as conn:
+        row = conn.execute(SQL_SELECT_RESET_TOKEN, (email.strip().lower(),)).fetchone()
+    if not row or row["reset_token"] != token:
+        return False, "Invalid or expired reset token."
+
+    pw_hash = hash_password(new_password)
+    with connection() as conn:
+        conn.execute(SQL_RESET_PASSWORD, (pw_hash, email.strip().lower()))
+    return True, "Password has been reset successfully."
+
+
+# ---------------------------
+# Documents
+# ---------------------------
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+SQL_INSERT_DOCUMENT = (
+    "INSERT INTO documents(user_id, filename, mime, content, created_at, preview, length, content_hash) "
+    "VALUES(?,?,?,?,?,?,?,?)"
+)
+# The library view only needs metadata and the preview; the body is loaded
+# on demand by get_document.
+SQL_LIST_DOCUMENTS = (
+    "SELECT id, filename, mime, preview, length, created_at FROM documents "
+    "WHERE user_id=? ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+)
+SQL_FIND_DOCUMENT_BY_HASH = "SELECT id FROM documents WHERE user_id=? AND content_hash=? LIMIT 1"
+SQL_COUNT_DOCUMENTS = "SELECT COUNT(*) FROM documents WHERE user_id=?"
+SQL_SELECT_DOCUMENT = "SELECT id, filename, mime, content, created_at FROM documents WHERE id=? AND user_id=?"
+SQL_DELETE_DOCUMENT = "DELETE FROM documents WHERE id=? AND user_id=?"
+
+
+SAVE_SECONDS = metrics.histogram("document_save_seconds", "Time spent in save_document.")
+SAVE_ERRORS = metrics.counter("document_save_errors_total", "save_document calls that raised.")
+SAVED = {
+    True: metrics.counter("documents_saved_total", "save_document calls by result.", result="created"),
+    False: metrics.counter("documents_saved_total", "save_document calls by result.", result="duplicate"),
+}
+LIST_SECONDS = metrics.histogram("document_list_seconds", "Time spent in list_documents.")
+
+
+def save_document(user_id: int, content: str, filename: str | None, mime: str | None) -> tuple[int, bool]:
+    # Identical content is stored once per user: returns (document id, created)
+    with SAVE_SECONDS.time(SAVE_ERRORS):
+        doc_id, created = _save_document(user_id, content, filename, mime)
+    SAVED[created].inc()
+    return doc_id, created
+
+
+def _save_document(user_id: int, content: str, filename: str | None, mime: str | None) -> tuple[int, bool]:
+    digest = content_hash(content)
+    with connection() as conn:
+        # IMMEDIATE takes the write lock up front so two sessions saving the
+        # same document cannot both miss the lookup and insert a duplicate
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(SQL_FIND_DOCUMENT_BY_HASH, (user_id, digest)).fetchone()
+        if row:
+            return row["id"], False
+        cur = conn.execute(
+            SQL_INSERT_DOCUMENT,
+            (
+                user_id,
+                filename,
+                mime,
+                content,
+                datetime.utcnow().isoformat(),
+                content[:PREVIEW_CHARS],
+                len(content),
+                digest,
+            ),
+        )
+        return cur.lastrowid, True
+
+
+def list_documents(user_id: int, limit: int = -1, offset: int = 0):
+    # limit=-1 means no limit in SQLite
+    with LIST_SECONDS.time(), connection() as conn:
+        return conn.execute(SQL_LIST_DOCUMENTS, (user_id, limit, offset)).fetchall()
+
+
+def count_documents(user_id: int) -> int:
+    with connection() as conn:
+        return conn.execute(SQL_COUNT_DOCUMENTS, (user_id,)).fetchone()[0]
+
+
+def get_document(doc_id: int, user_id: int):
+    with connection() as conn:
+        return conn.execute(SQL_SELECT_DOCUMENT, (doc_id, user_id)).fetchone()
+
+
+def delete_document(doc_id: int, user_id: int):
+    with connection() as conn:
+        conn.execute(SQL_DELETE_DOCUMENT, (doc_id, user_id))
+
+
+# ---------------------------
+# Search
+# ---------------------------
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+SQL_SEARCH_DOCUMENTS = (
+    "SELECT d.id, d.filename, d.mime, d.length, d.created_at, "
+    f"snippet(documents_fts, 1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 24) AS snippet, "
+    "bm25(documents_fts) AS rank "
+    "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+    "WHERE documents_fts MATCH ? AND d.user_id = ? "
+    "ORDER BY rank LIMIT ?"
+)
+
+
+def fts_query(text: str) -> str:
+    # Turn free text into a safe FTS5 query: every word must match, and the
+    # last word also matches as a prefix so results update while typing.
+    words = re.findall(r"\w+", text)
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+
+def search_documents(user_id: int, text: str, limit: int = 50):
+    # Ranked by BM25 (lower is better); snippets mark hits with SNIPPET_START/END
+    query = fts_query(text)
+    if not query:
+        return []
+    with connection() as conn:
+        return conn.execute(SQL_SEARCH_DOCUMENTS, (query, user_id, limit)).fetchall()
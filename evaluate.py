@@ -0,0 +1,352 @@
+# evaluate.py
+# -------------------------------------------------------------
+# Offline evaluation of the intent classifier on intents.json
+#
+# Stratified k-fold cross-validation of the same TF-IDF + LogisticRegression
+# pipeline the apps train (intent_model.train_model). Folds run in parallel
+# worker processes. Each fold's held-out patterns are scored in one
+# predict_proba call, and the confusion matrix is built with a single
+# bincount over the out-of-fold predictions. Reported:
+#   accuracy, macro F1, the worst tags and the most frequent confusions
+#   calibration: confidence bins against observed accuracy (ECE), and how
+#     coverage and accuracy change with the confidence threshold (the apps
+#     use CONFIDENCE_THRESHOLD = 0.5 to fall back)
+#   timings: fit per fold, batched and single-message inference
+#
+# --sweep cross-validates every combination of ngram_range, max_features and
+# solver. Results are cached per configuration under models/eval, keyed by the
+# intents.json content, the parameters, k and the seed, so a rerun only
+# evaluates what changed.
+#
+# How to run:
+#   python evaluate.py                     # current parameters, 3 folds
+#   python evaluate.py --folds 5 --jobs 4
+#   python evaluate.py --sweep --output eval.json
+# -------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import itertools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+from intent_model import (
+    ARTIFACT_DIR,
+    CLASSIFIER_PARAMS,
+    CONFIDENCE_THRESHOLD,
+    INTENTS_PATH,
+    VECTORIZER_PARAMS,
+    fingerprint,
+    train_model,
+    training_set,
+)
+from linear_engine import LinearEngine
+
+DEFAULT_FOLDS = 3  # most tags have three patterns
+EVAL_CACHE_DIR = os.path.join(ARTIFACT_DIR, "eval")
+CALIBRATION_BINS = 10  # equal-count bins
+THRESHOLDS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+TOP_N = 10
+
+SWEEP_GRID = {
+    "ngram_range": [(1, 1), (1, 2), (1, 3)],
+    "max_features": [1000, 5000, None],
+    "solver": ["liblinear", "lbfgs"],
+}
+
+
+# ---------------------------
+# One fold (runs in a worker process)
+# ---------------------------
+def _run_fold(patterns: list[str], tags: list[str], train_idx, test_idx, vectorizer_params: dict, classifier_params: dict) -> dict:
+    # train_model takes intents; one single-pattern intent per training row
+    fold_intents = [{"tag": tags[i], "patterns": [patterns[i]]} for i in train_idx]
+    start = time.perf_counter()
+    vectorizer, clf = train_model(fold_intents, vectorizer_params, classifier_params)
+    fit_seconds = time.perf_counter() - start
+
+    test_texts = [patterns[i] for i in test_idx]
+    start = time.perf_counter()
+    proba = clf.predict_proba(vectorizer.transform(test_texts))
+    batch_seconds = time.perf_counter() - start
+
+    # Single messages, as predict() serves them
+    engine = LinearEngine(vectorizer, clf)
+    start = time.perf_counter()
+    for text in test_texts:
+        engine.best(text)
+    single_seconds = time.perf_counter() - start
+
+    best = proba.argmax(axis=1)
+    return {
+        "test_idx": list(map(int, test_idx)),
+        "predicted": [str(clf.classes_[i]) for i in best],
+        "confidence": proba[np.arange(len(best)), best].tolist(),
+        "fit_seconds": fit_seconds,
+        "batch_seconds": batch_seconds,
+        "single_seconds": single_seconds,
+    }
+
+
+def _folds(tags: list[str], k: int, seed: int) -> list[tuple[list[int], list[int]]]:
+    splitter = StratifiedKFold(n_splits=k, shuffle=True, random_state=seed)
+    with warnings.catch_warnings():
+        # Tags with fewer than k patterns are simply absent from some test folds
+        warnings.filterwarnings("ignore", message="The least populated class")
+        return [(train.tolist(), test.tolist()) for train, test in splitter.split(np.zeros(len(tags)), tags)]
+
+
+# ---------------------------
+# Scoring
+# ---------------------------
+def score(tags: list[str], fold_results: list[dict], threshold: float = CONFIDENCE_THRESHOLD) -> dict:
+    n = len(tags)
+    predicted = [None] * n
+    confidence = np.zeros(n)
+    for fold in fold_results:
+        for i, pred, conf in zip(fold["test_idx"], fold["predicted"], fold["confidence"]):
+            predicted[i] = pred
+            confidence[i] = conf
+
+    labels = sorted(set(tags) | set(predicted))
+    index = {tag: i for i, tag in enumerate(labels)}
+    y_true = np.fromiter((index[t] for t in tags), dtype=np.intp, count=n)
+    y_pred = np.fromiter((index[p] for p in predicted), dtype=np.intp, count=n)
+    m = len(labels)
+    confusion = np.bincount(y_true * m + y_pred, minlength=m * m).reshape(m, m)
+    correct = y_true == y_pred
+
+    # Per-tag precision / recall / F1 from the confusion matrix
+    tp = np.diag(confusion).astype(float)
+    support = confusion.sum(axis=1)
+    predicted_count = confusion.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted_count > 0, tp / predicted_count, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    present = support > 0
+    per_tag = {
+        labels[i]: {"precision": precision[i], "recall": recall[i], "f1": f1[i], "support": int(support[i])}
+        for i in np.flatnonzero(present)
+    }
+
+    off_diagonal = confusion.copy()
+    np.fill_diagonal(off_diagonal, 0)
+    pairs = np.flatnonzero(off_diagonal)
+    pairs = pairs[np.argsort(-off_diagonal.flat[pairs], kind="stable")]
+    confusions = [(labels[p // m], labels[p % m], int(off_diagonal.flat[p])) for p in pairs]
+
+    # Reliability: observed accuracy per confidence bin. Bins hold equal
+    # counts, because with many one-vs-rest classes the confidences crowd
+    # into a narrow low range that fixed-width bins would lump together
+    order = np.argsort(confidence, kind="stable")
+    calibration = []
+    ece = 0.0
+    for members in np.array_split(order, min(CALIBRATION_BINS, n)):
+        mean_conf, accuracy = float(confidence[members].mean()), float(correct[members].mean())
+        ece += len(members) / n * abs(mean_conf - accuracy)
+        calibration.append(
+            {"low": float(confidence[members[0]]), "high": float(confidence[members[-1]]), "count": len(members),
+             "mean_confidence": mean_conf, "accuracy": accuracy}
+        )
+
+    # Threshold sweep: answers at or above t are kept, the rest fall back.
+    # Fixed points plus the confidence deciles, so the table is informative
+    # whatever range the confidences fall in.
+    deciles = np.quantile(confidence, np.linspace(0.1, 0.9, 9)).round(4)
+    thresholds = []
+    for t in sorted(set(THRESHOLDS) | set(map(float, deciles)) | {threshold}):
+        kept = confidence >= t
+        thresholds.append(
+            {"threshold": t, "coverage": float(kept.mean()),
+             "accuracy_kept": float(correct[kept].mean()) if kept.any() else None,
+             "correct_rejected": float(correct[~kept].mean()) if (~kept).any() else None}
+        )
+
+    return {
+        "patterns": n,
+        "tags": int(present.sum()),
+        "accuracy": float(correct.mean()),
+        "macro_f1": float(f1[present].mean()),
+        "per_tag": {tag: {k: float(v) if k != "support" else v for k, v in row.items()} for tag, row in per_tag.items()},
+        "confusions": confusions,
+        "calibration": calibration,
+        "ece": float(ece),
+        "thresholds": thresholds,
+        "threshold": threshold,
+    }
+
+
+def _timings(fold_results: list[dict]) -> dict:
+    tested = sum(len(f["test_idx"]) for f in fold_results)
+    return {
+        "fit_seconds_per_fold": float(np.mean([f["fit_seconds"] for f in fold_results])),
+        "batch_us_per_message": sum(f["batch_seconds"] for f in fold_results) / tested * 1e6,
+        "single_us_per_message": sum(f["single_seconds"] for f in fold_results) / tested * 1e6,
+    }
+
+
+# ---------------------------
+# Cross-validation with a per-configuration cache
+# ---------------------------
+def config_key(intents_bytes: bytes, vectorizer_params: dict, classifier_params: dict, k: int, seed: int) -> str:
+    return f"{fingerprint(intents_bytes, vectorizer_params, classifier_params)}-k{k}-s{seed}"
+
+
+def _jsonable(params: dict) -> dict:
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in params.items()}
+
+
+def cross_validate(
+    configs: list[tuple[dict, dict]],
+    intents_path: str = INTENTS_PATH,
+    k: int = DEFAULT_FOLDS,
+    seed: int = 0,
+    jobs: int | None = None,
+    cache_dir: str | None = EVAL_CACHE_DIR,
+) -> list[dict]:
+    # One result per (vectorizer_params, classifier_params). Every fold of
+    # every uncached configuration is one task on the same process pool.
+    with open(intents_path, "rb") as f:
+        intents_bytes = f.read()
+    patterns, tags = training_set(json.loads(intents_bytes))
+    folds = _folds(tags, k, seed)
+
+    results = [None] * len(configs)
+    pending = []
+    for n, (vectorizer_params, classifier_params) in enumerate(configs):
+        key = config_key(intents_bytes, vectorizer_params, classifier_params, k, seed)
+        path = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                results[n] = {**json.load(f), "cached": True}
+        else:
+            pending.append((n, key, path, vectorizer_params, classifier_params))
+
+    tasks = [
+        (n, (patterns, tags, train, test, vectorizer_params, classifier_params))
+        for n, _, _, vectorizer_params, classifier_params in pending
+        for train, test in folds
+    ]
+    jobs = jobs or os.cpu_count() or 1
+    fold_results = {n: [] for n, *_ in pending}
+    if jobs == 1 or len(tasks) <= 1:
+        for n, args in tasks:
+            fold_results[n].append(_run_fold(*args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+            futures = [(n, pool.submit(_run_fold, *args)) for n, args in tasks]
+            for n, future in futures:
+                fold_results[n].append(future.result())
+
+    for n, key, path, vectorizer_params, classifier_params in pending:
+        result = {
+            "key": key,
+            "vectorizer": _jsonable(vectorizer_params),
+            "classifier": _jsonable(classifier_params),
+            "folds": k,
+            "seed": seed,
+            **score(tags, fold_results[n]),
+            "timings": _timings(fold_results[n]),
+        }
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+        results[n] = {**result, "cached": False}
+    return results
+
+
+def sweep_configs(grid: dict = SWEEP_GRID) -> list[tuple[dict, dict]]:
+    configs = []
+    for ngram_range, max_features, solver in itertools.product(grid["ngram_range"], grid["max_features"], grid["solver"]):
+        configs.append(
+            (
+                {**VECTORIZER_PARAMS, "ngram_range": ngram_range, "max_features": max_features},
+                {**CLASSIFIER_PARAMS, "solver": solver},
+            )
+        )
+    return configs
+
+
+# ---------------------------
+# Report
+# ---------------------------
+def print_report(result: dict, top: int = TOP_N):
+    print(f"{result['patterns']} patterns, {result['tags']} tags, {result['folds']}-fold CV"
+          f"{' (cached)' if result.get('cached') else ''}")
+    print(f"accuracy {result['accuracy']:.3f}   macro F1 {result['macro_f1']:.3f}   ECE {result['ece']:.3f}")
+    t = result["timings"]
+    print(f"fit {t['fit_seconds_per_fold']:.2f}s/fold   inference {t['batch_us_per_message']:.0f} us/message batched, "
+          f"{t['single_us_per_message']:.0f} us/message single")
+
+    worst = sorted(result["per_tag"].items(), key=lambda item: (item[1]["f1"], item[0]))[:top]
+    print(f"\nWorst tags (F1, precision, recall, support):")
+    for tag, row in worst:
+        print(f"  {row['f1']:.2f}  {row['precision']:.2f}  {row['recall']:.2f}  {row['support']:>3}  {tag}")
+
+    print(f"\nMost frequent confusions (true -> predicted):")
+    for true, pred, count in result["confusions"][:top]:
+        print(f"  {count:>3}  {true} -> {pred}")
+
+    print("\nCalibration (confidence range: mean confidence / accuracy, count):")
+    for row in result["calibration"]:
+        print(f"  {row['low']:.3f}-{row['high']:.3f}: {row['mean_confidence']:.3f} / {row['accuracy']:.2f}  ({row['count']})")
+
+    print("\nConfidence threshold (kept = answered from the predicted tag):")
+    print("  threshold  coverage  accuracy kept  correct among rejected")
+    for row in result["thresholds"]:
+        mark = "  <- CONFIDENCE_THRESHOLD" if row["threshold"] == result["threshold"] else ""
+        kept = "-" if row["accuracy_kept"] is None else f"{row['accuracy_kept']:.3f}"
+        rejected = "-" if row["correct_rejected"] is None else f"{row['correct_rejected']:.3f}"
+        print(f"  {row['threshold']:>9.4f}  {row['coverage']:>8.3f}  {kept:>13}  {rejected:>22}{mark}")
+    at_threshold = next(row for row in result["thresholds"] if row["threshold"] == result["threshold"])
+    if at_threshold["coverage"] == 0:
+        print(f"  No prediction reaches {result['threshold']}: every reply takes the low-confidence path.")
+
+
+def print_sweep(results: list[dict]):
+    print(f"{'accuracy':>8} {'macro F1':>8} {'ECE':>6} {'fit s':>6} {'us/msg':>7}  ngram  max_features  solver")
+    for r in sorted(results, key=lambda r: (-r["accuracy"], r["timings"]["fit_seconds_per_fold"])):
+        t = r["timings"]
+        print(
+            f"{r['accuracy']:>8.3f} {r['macro_f1']:>8.3f} {r['ece']:>6.3f} {t['fit_seconds_per_fold']:>6.2f} "
+            f"{t['single_us_per_message']:>7.0f}  {tuple(r['vectorizer']['ngram_range'])}  "
+            f"{str(r['vectorizer']['max_features']):>12}  {r['classifier']['solver']}{'  (cached)' if r['cached'] else ''}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cross-validate the intent classifier.")
+    parser.add_argument("--intents", default=INTENTS_PATH)
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--sweep", action="store_true", help="cross-validate the ngram/max_features/solver grid")
+    parser.add_argument("--no-cache", action="store_true", help=f"ignore and do not write {EVAL_CACHE_DIR}")
+    parser.add_argument("--output", help="write the full results as JSON")
+    args = parser.parse_args()
+
+    configs = sweep_configs() if args.sweep else [(VECTORIZER_PARAMS, CLASSIFIER_PARAMS)]
+    start = time.perf_counter()
+    results = cross_validate(
+        configs, args.intents, args.folds, args.seed, args.jobs, None if args.no_cache else EVAL_CACHE_DIR
+    )
+    elapsed = time.perf_counter() - start
+    if args.sweep:
+        print_sweep(results)
+    else:
+        print_report(results[0])
+    print(f"\n{len(configs)} configuration(s) in {elapsed:.1f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results if args.sweep else results[0], f, indent=2)
+        print(f"results: {args.output}")
@@ -0,0 +1,381 @@
+# extraction.py
+# -------------------------------------------------------------
+# Streaming text extraction for uploaded TXT / DOCX / PDF files
+#
+# Text is produced incrementally (PDF page ranges, DOCX paragraphs, TXT
+# blocks) and written straight to a UTF-8 text file on disk, so the
+# whole document is never held in memory during extraction. Large PDFs are
+# split into page ranges that are extracted in a shared process pool;
+# results are streamed back in page order with progress reporting.
+#
+# Extracted text is cached on disk under .cache/extracted, keyed by the
+# SHA-256 of the raw upload bytes, with LRU eviction once the cache exceeds
+# CACHE_MAX_BYTES. Re-parsing an unchanged file (e.g. on every Streamlit
+# rerun while it sits in the uploader) is a cache hit. An ExtractedText whose
+# entry was evicted before it is read extracts its upload again.
+# -------------------------------------------------------------
+
+import os
+import json
+import time
+import codecs
+import hashlib
+import multiprocessing
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator
+
+import metrics
+
+# Optional parsers for multi-format upload
+try:
+    from docx import Document as DocxDocument  # python-docx
+except Exception:
+    DocxDocument = None
+
+try:
+    from PyPDF2 import PdfReader
+except Exception:
+    PdfReader = None
+
+PAGES_PER_TASK = 8
+PARALLEL_MIN_PAGES = 16  # below this, process start-up costs more than it saves
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+READ_BLOCK_SIZE = 1 << 20  # 1 MB
+SPOOL_DIR = os.path.join(tempfile.gettempdir(), "milestone1_extracted")
+CACHE_DIR = os.path.join(".cache", "extracted")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# progress(done, total) with units of pages (PDF), paragraphs (DOCX) or bytes (TXT)
+Progress = Callable[[int, int], None]
+
+
+@dataclass
+class ExtractedText:
+    path: str
+    filename: str
+    mime: str
+    length: int  # characters
+    raw_hash: str  # sha256 of the uploaded bytes
+    cached: bool = False
+    upload: object = field(default=None, repr=False, compare=False)  # source of the text, see _open
+
+    def _open(self):
+        try:
+            return open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            if self.upload is None:
+                raise
+        # Evicted from the cache since extraction (e.g. by another session's
+        # upload before Save was clicked): extract the upload again
+        self.path = extract_upload(self.upload).path
+        return open(self.path, "r", encoding="utf-8")
+
+    def read(self) -> str:
+        with self._open() as f:
+            return f.read()
+
+    def preview(self, n_chars: int) -> str:
+        with self._open() as f:
+            return f.read(n_chars)
+
+
+# ---------------------------
+# PDF
+# ---------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Workers are never forked from the Streamlit server: a fork would copy
+    # its threads' locks (chat log writer, reload watcher, metrics server) in
+    # whatever state they are in. forkserver starts them from a clean process;
+    # spawn where forkserver is unavailable (Windows).
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+# Each worker process keeps the reader of the document it is working on, so
+# the file is parsed once per worker rather than once per page range.
+_worker_reader = (None, None)
+
+
+def _extract_pdf_range(path: str, start: int, stop: int) -> list[str]:
+    global _worker_reader
+    key = (path, os.stat(path).st_mtime_ns)
+    if _worker_reader[0] != key:
+        _worker_reader = (key, PdfReader(path))
+    reader = _worker_reader[1]
+    pages = []
+    for i in range(start, stop):
+        try:
+            pages.append(reader.pages[i].extract_text() or "")
+        except Exception:
+            pages.append("")
+    return pages
+
+
+def _iter_pdf_pages(path: str, progress: Progress | None) -> Iterator[str]:
+    if PdfReader is None:
+        raise RuntimeError("PyPDF2 not installed. Run: pip install PyPDF2")
+    reader = PdfReader(path)
+    n_pages = len(reader.pages)
+
+    if n_pages < PARALLEL_MIN_PAGES or MAX_WORKERS < 2:
+        for i, page in enumerate(reader.pages, 1):
+            try:
+                text = page.extract_text() or ""
+            except Exception:
+                text = ""
+            if progress:
+                progress(i, n_pages)
+            yield text
+        return
+
+    # Keep a bounded window of page ranges in flight so finished-but-unconsumed
+    # text never piles up in memory; results are consumed in page order.
+    pool = _get_pool()
+    ranges = iter([(s, min(s + PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PAGES_PER_TASK)])
+    window = deque()
+    for start, stop in ranges:
+        window.append(pool.submit(_extract_pdf_range, path, start, stop))
+        if len(window) >= MAX_WORKERS * 2:
+            break
+    done = 0
+    while window:
+        pages = window.popleft().result()
+        nxt = next(ranges, None)
+        if nxt is not None:
+            window.append(pool.submit(_extract_pdf_range, path, *nxt))
+        for text in pages:
+            done += 1
+            if progress:
+                progress(done, n_pages)
+            yield text
+
+
+# ---------------------------
+# DOCX / TXT
+# ---------------------------
+def _iter_docx_paragraphs(path: str, progress: Progress | None) -> Iterator[str]:
+    if DocxDocument is None:
+        raise RuntimeError("python-docx not installed. Run: pip install python-docx")
+    paragraphs = DocxDocument(path).paragraphs
+    total = len(paragraphs)
+    for i, p in enumerate(paragraphs, 1):
+        if progress and (i % 200 == 0 or i == total):
+            progress(i, total)
+        yield p.text
+
+
+def _iter_text_blocks(path: str, progress: Progress | None) -> Iterator[str]:
+    # Incremental decoder so multi-byte characters split across blocks survive
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    total = os.path.getsize(path)
+    done = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            done += len(block)
+            if progress:
+                progress(done, total)
+            yield decoder.decode(block)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+# ---------------------------
+# Extraction cache
+# ---------------------------
+_cache_lock = threading.Lock()
+
+
+def _parser_kind(filename: str) -> str:
+    name_lower = filename.lower()
+    if name_lower.endswith(".pdf"):
+        return "pdf"
+    if name_lower.endswith(".docx"):
+        return "docx"
+    return "txt"
+
+
+def _cache_paths(key: str) -> tuple[str, str]:
+    base = os.path.join(CACHE_DIR, key)
+    return base + ".txt", base + ".json"
+
+
+def _cache_lookup(key: str) -> int | None:
+    text_path, meta_path = _cache_paths(key)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            length = json.load(f)["length"]
+        # Touch both files: mtime is the LRU clock used by _evict
+        os.utime(text_path)
+        os.utime(meta_path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    return length
+
+
+def _evict(max_bytes: int | None = None):
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    with _cache_lock:
+        entries, total = [], 0
+        for entry in os.scandir(CACHE_DIR):
+            if entry.name.endswith(".txt"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, entry.path, st.st_size))
+                total += st.st_size
+        entries.sort()
+        for _, path, size in entries:
+            if total <= max_bytes:
+                break
+            for victim in (path, path[: -len(".txt")] + ".json"):
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+# ---------------------------
+# Metrics
+# ---------------------------
+# Labelled by cache result so throughput can be computed over real
+# extractions (cache="miss") without hits skewing it.
+UPLOAD_SECONDS = {
+    cache: metrics.histogram("upload_extract_seconds", "Time spent in extract_upload.", cache=cache)
+    for cache in ("hit", "miss")
+}
+UPLOAD_BYTES = {
+    cache: metrics.counter("upload_bytes_total", "Raw bytes of uploads passed to extract_upload.", cache=cache)
+    for cache in ("hit", "miss")
+}
+UPLOAD_ERRORS = metrics.counter("upload_errors_total", "extract_upload calls that raised.")
+# A file sitting in the uploader is passed to extract_upload on every
+# Streamlit rerun; it is counted as an upload only the first time its
+# content hash is seen (among the last SEEN_UPLOADS_MAX)
+UPLOAD_FILES = metrics.counter("upload_files_total", "Distinct uploads, by content hash, passed to extract_upload.")
+SEEN_UPLOADS_MAX = 4096
+_seen_uploads = OrderedDict()
+_seen_uploads_lock = threading.Lock()
+
+
+def _count_upload(raw_hash: str):
+    with _seen_uploads_lock:
+        if raw_hash in _seen_uploads:
+            _seen_uploads.move_to_end(raw_hash)
+            return
+        _seen_uploads[raw_hash] = None
+        if len(_seen_uploads) > SEEN_UPLOADS_MAX:
+            _seen_uploads.popitem(last=False)
+    UPLOAD_FILES.inc()
+
+
+# ---------------------------
+# Pipeline
+# ---------------------------
+def _spool_upload(uploaded_file) -> tuple[str, str]:
+    # Uploads arrive as in-memory buffers; parsers and worker processes read
+    # them from disk instead of receiving a copy of the bytes. The raw bytes
+    # are hashed on the way through to key the extraction cache.
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=".upload")
+    digest = hashlib.sha256()
+    with os.fdopen(fd, "wb") as f:
+        if hasattr(uploaded_file, "seek"):
+            uploaded_file.seek(0)
+        while True:
+            block = uploaded_file.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+    return path, digest.hexdigest()
+
+
+def iter_upload_text(upload_path: str, filename: str, progress: Progress | None = None) -> Iterator[tuple[str, str]]:
+    # Yields (separator, text) pieces; separators reproduce "\n".join(...)
+    kind = _parser_kind(filename)
+    if kind == "pdf":
+        pieces, sep = _iter_pdf_pages(upload_path, progress), "\n"
+    elif kind == "docx":
+        pieces, sep = _iter_docx_paragraphs(upload_path, progress), "\n"
+    else:
+        pieces, sep = _iter_text_blocks(upload_path, progress), ""
+    first = True
+    for piece in pieces:
+        yield ("" if first else sep), piece
+        first = False
+
+
+def extract_upload(uploaded_file, progress: Progress | None = None) -> ExtractedText:
+    start = time.perf_counter()
+    try:
+        extracted, size = _extract_upload(uploaded_file, progress)
+    except BaseException:
+        UPLOAD_ERRORS.inc()
+        raise
+    cache = "hit" if extracted.cached else "miss"
+    UPLOAD_SECONDS[cache].observe(time.perf_counter() - start)
+    UPLOAD_BYTES[cache].inc(size)
+    _count_upload(extracted.raw_hash)
+    return extracted
+
+
+def _extract_upload(uploaded_file, progress: Progress | None) -> tuple[ExtractedText, int]:
+    # Returns the extracted text and the raw upload size in bytes
+    filename = uploaded_file.name
+    mime = getattr(uploaded_file, "type", None) or ""
+    upload_path, raw_hash = _spool_upload(uploaded_file)
+    try:
+        size = os.path.getsize(upload_path)
+        key = f"{raw_hash}-{_parser_kind(filename)}"
+        text_path, meta_path = _cache_paths(key)
+
+        length = _cache_lookup(key)
+        if length is not None:
+            return ExtractedText(text_path, filename, mime, length, raw_hash, cached=True, upload=uploaded_file), size
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        length = 0
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as out:
+                for sep, piece in iter_upload_text(upload_path, filename, progress):
+                    out.write(sep)
+                    out.write(piece)
+                    length += len(sep) + len(piece)
+            # Text first, metadata last: an entry only counts once its .json exists
+            os.replace(tmp_path, text_path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"length": length, "filename": filename}, f)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    finally:
+        os.remove(upload_path)
+
+    _evict()
+    return ExtractedText(text_path, filename, mime, length, raw_hash, upload=uploaded_file), size
+
+
+def read_text_from_upload(uploaded_file) -> tuple[str, str, str]:
+    extracted = extract_upload(uploaded_file)
+    return extracted.read(), extracted.filename, extracted.mime
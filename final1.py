@@ -1,52 +1,43 @@
 import os
-import json
 import datetime
-import csv
-import nltk
-import ssl
+import uuid
 import streamlit as st
-import random
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-
-ssl._create_default_https_context = ssl._create_unverified_context
-nltk.data.path.append(os.path.abspath("nltk_data"))
-nltk.download('punkt')
-
-# Load intents from the JSON file
+from intent_model import get_model_holder, predict
+from hot_reload import watch_intents
+from conversation_store import get_store
+from chat_archive import get_history
+
+# Load the intents and the trained model; the classifier is cached as a
+# fingerprinted artifact under ./models and only retrained when intents.json
+# or the hyperparameters below change. The holder is process-wide, so reruns
+# and other sessions reuse the loaded model.
 file_path = os.path.abspath("./intents.json")
-with open(file_path, "r") as file:
-    intents = json.load(file)
-
-# Create the vectorizer and classifier
-vectorizer = TfidfVectorizer()
-clf = LogisticRegression(random_state=0, max_iter=10000)
-
-# Preprocess the data
-tags = []
-patterns = []
-for intent in intents:
-    for pattern in intent['patterns']:
-        tags.append(intent['tag'])
-        patterns.append(pattern)
-
-# training the model
-x = vectorizer.fit_transform(patterns)
-y = tags
-clf.fit(x, y)
+model_holder = get_model_holder(
+    file_path,
+    vectorizer_params={},
+    classifier_params={"random_state": 0, "max_iter": 10000},
+)
+model_holder.get()
+# Reload intents.json on change without restarting (see hot_reload.py)
+watch_intents(model_holder, file_path)
 
 def chatbot(input_text):
-    input_text = vectorizer.transform([input_text])
-    tag = clf.predict(input_text)[0]
-    for intent in intents:
-        if intent['tag'] == tag:
-            response = random.choice(intent['responses'])
-            return response
+    # Top intent (no fallback tag is configured here), memoized per
+    # normalized input; the reply is still drawn at random for each call
+    return predict(model_holder.get(), input_text).response
         
 counter = 0
 
+# Conversation log shared by all sessions in this process
+chat_store = get_store()
+# Live log plus its Parquet archive (old turns are rotated out in the background)
+chat_history = get_history(chat_store)
+HISTORY_PAGE_SIZE = 25
+
 def main():
     global counter
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 	
     page_bg_img = f"""
 <style>
@@ -68,12 +59,6 @@ background-image: none;
     if choice == "Home":
         st.write("Welcome to the chatbot. Please type a message and press Enter to start the conversation.")
 
-        # Check if the chat_log.csv file exists, and if not, create it with column names
-        if not os.path.exists('chat_log.csv'):
-            with open('chat_log.csv', 'w', newline='', encoding='utf-8') as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerow(['User Input', 'Chatbot Response', 'Timestamp'])
-
         counter += 1
         user_input = st.text_input("You:", key=f"user_input_{counter}")
 
@@ -88,10 +73,8 @@ background-image: none;
             # Get the current timestamp
             timestamp = datetime.datetime.now().strftime(f"%Y-%m-%d %H:%M:%S")
 
-            # Save the user input and chatbot response to the chat_log.csv file
-            with open('chat_log.csv', 'a', newline='', encoding='utf-8') as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerow([user_input_str, response, timestamp])
+            # Save the user input and chatbot response to the conversation store
+            chat_store.append(user_input_str, response, st.session_state.session_id, timestamp)
 
             if response.lower() in ['goodbye', 'bye']:
                 st.write("Thank you for chatting with me. Have a great day!")
@@ -103,14 +86,25 @@ background-image: none;
         # Display the conversation history in a collapsible expander
         st.header("Conversation History")
         # with st.beta_expander("Click to see Conversation History"):
-        with open('chat_log.csv', 'r', encoding='utf-8') as csvfile:
-            csv_reader = csv.reader(csvfile)
-            next(csv_reader)  # Skip the header row
-            for row in csv_reader:
-                st.text(f"User: {row[0]}")
-                st.text(f"Chatbot: {row[1]}")
-                st.text(f"Timestamp: {row[2]}")
-                st.markdown("---")
+        # One keyset page at a time (newest first), so rendering does not
+        # grow with the log or decode the whole archive
+        cursors = st.session_state.setdefault("history_cursors", [None])
+        rows = chat_history.latest(HISTORY_PAGE_SIZE + 1, cursors[-1])
+        has_older = len(rows) > HISTORY_PAGE_SIZE
+        rows = rows[:HISTORY_PAGE_SIZE]
+        for row in rows:
+            st.text(f"User: {row['user_input']}")
+            st.text(f"Chatbot: {row['response']}")
+            st.text(f"Timestamp: {row['created_at']}")
+            st.markdown("---")
+
+        newer_col, older_col, _ = st.columns([0.15, 0.15, 0.7])
+        if newer_col.button("← Newer", key="history_newer", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if older_col.button("Older →", key="history_older", disabled=not has_older):
+            cursors.append(rows[-1]["id"])
+            st.rerun()
 
     elif choice == "About":
         st.write("The goal of this project is to create a chatbot that can understand and respond to user input based on intents. The chatbot is built using Natural Language Processing (NLP) library and Logistic Regression, to extract the intents and entities from user input. The chatbot is built using Streamlit, a Python library for building interactive web applications.")
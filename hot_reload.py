@@ -0,0 +1,98 @@
+# hot_reload.py
+# -------------------------------------------------------------
+# Watch intents.json and hot-swap the shared model when it changes
+#
+# A watchdog observer watches the directory holding the intents file (editors
+# often save by writing a temp file and renaming it over the original, which
+# only shows up as a directory event). Bursts of events are debounced, then
+# ModelHolder.refresh() validates the new corpus, rebuilds only what changed
+# (see intent_model.update_model) and swaps the model in atomically; requests
+# keep being served by the old model until then. An invalid file leaves the
+# current model in place.
+#
+# Reload latency is recorded in the model_reload_seconds histogram and in
+# holder.last_reload.
+# -------------------------------------------------------------
+
+import os
+import threading
+import warnings
+
+from intent_model import ModelHolder
+
+# Optional: without watchdog the app still runs, just without hot reload
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except Exception:
+    Observer = None
+    FileSystemEventHandler = object
+
+DEBOUNCE_SECONDS = 0.5
+RELOAD_EVENTS = ("created", "modified", "moved", "closed")
+
+
+class _IntentsFileHandler(FileSystemEventHandler):
+    def __init__(self, path: str, holder: ModelHolder):
+        self.path = path
+        self.holder = holder
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def on_any_event(self, event):
+        # Opens and no-write closes are ignored: refresh() reading the file
+        # would otherwise trigger another reload
+        if event.is_directory or event.event_type not in RELOAD_EVENTS:
+            return
+        paths = (event.src_path, getattr(event, "dest_path", None))
+        if any(p and os.path.abspath(p) == self.path for p in paths):
+            self._schedule()
+
+    def _schedule(self):
+        # Restart the countdown on every event so one save triggers one reload
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(DEBOUNCE_SECONDS, self._reload)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _reload(self):
+        if not os.path.exists(self.path):
+            return  # mid-rename; the next event will bring it back
+        try:
+            self.holder.refresh()
+        except Exception as e:
+            warnings.warn(f"Ignoring invalid {os.path.basename(self.path)}, keeping the current model: {e}")
+
+
+_observers = {}
+_observers_lock = threading.Lock()
+
+
+def watch_intents(holder: ModelHolder, intents_path: str):
+    # Once per file and holder per process, so Streamlit reruns calling this are no-ops.
+    # Returns the observer, or None when watchdog is not installed.
+    path = os.path.abspath(intents_path)
+    key = (path, id(holder))
+    with _observers_lock:
+        if key in _observers:
+            return _observers[key]
+        if Observer is None:
+            warnings.warn("watchdog not installed; intents.json will not be hot-reloaded. Run: pip install watchdog")
+            _observers[key] = None
+            return None
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(_IntentsFileHandler(path, holder), os.path.dirname(path), recursive=False)
+        observer.start()
+        _observers[key] = observer
+        return observer
+
+
+def stop_watching():
+    with _observers_lock:
+        for observer in _observers.values():
+            if observer is not None:
+                observer.stop()
+        _observers.clear()
@@ -0,0 +1,614 @@
+# intent_model.py
+# -------------------------------------------------------------
+# Intent classifier build step and versioned model artifacts
+#
+# How to run:
+#   python intent_model.py            # build the artifact if it is stale
+#   python intent_model.py --force    # retrain even if it is up to date
+#
+# Artifacts are written to ./models/intent_model-<fingerprint>.pkl, where the
+# fingerprint hashes intents.json together with the hyperparameters, so the
+# app only retrains when one of them changes.
+# -------------------------------------------------------------
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import random
+import warnings
+import threading
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+import metrics
+from linear_engine import LinearEngine
+
+ARTIFACT_VERSION = 1
+ARTIFACT_DIR = "models"
+INTENTS_PATH = "intents.json"
+
+VECTORIZER_PARAMS = {"max_features": 5000, "ngram_range": (1, 2)}
+CLASSIFIER_PARAMS = {"random_state": 0, "max_iter": 10000, "solver": "liblinear"}
+
+CONFIDENCE_THRESHOLD = 0.5
+BATCH_CHUNK_SIZE = 1024
+MEMO_SIZE = 4096  # normalized utterances remembered per model
+# Chunks up to this size are scored by the NumPy engine; larger ones amortize
+# sklearn's per-call overhead and are faster through its sparse matmul
+ENGINE_MAX_CHUNK = 16
+
+
+# ---------------------------
+# Prediction memo
+# ---------------------------
+MEMO_HITS = metrics.counter("inference_memo_hits_total", "predict() calls answered from the memo.")
+MEMO_MISSES = metrics.counter("inference_memo_misses_total", "predict() calls that ran the classifier.")
+
+
+class PredictionMemo:
+    # Bounded LRU of normalized utterance -> (class index, confidence). The
+    # response is still drawn per request, so repeats keep their variety.
+    # Each IntentModel owns one, so a reloaded model starts with an empty memo.
+    def __init__(self, capacity: int = MEMO_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> tuple[int, float] | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        (MEMO_MISSES if value is None else MEMO_HITS).inc()
+        return value
+
+    def put(self, key: str, value: tuple[int, float]):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@dataclass(frozen=True)
+class IntentModel:
+    fingerprint: str
+    vectorizer: TfidfVectorizer
+    clf: LogisticRegression
+    intents: list
+    train_seconds: float
+    # Compiled response lookups: tag -> responses, and class index -> responses
+    # aligned with clf.classes_, so picking a reply is a single array lookup.
+    responses_by_tag: dict
+    class_responses: list
+    fallback_responses: tuple | None
+    # True when built by update_model without a full retrain (vocabulary
+    # reuse or warm start), i.e. not what train_model would produce
+    incremental: bool = False
+    # Lean scorer for single messages; None if it did not match sklearn
+    engine: LinearEngine | None = None
+    memo: PredictionMemo = field(default_factory=PredictionMemo, compare=False)
+
+    def memo_key(self, text: str) -> str:
+        # Whitespace and (when the vectorizer lowercases) case cannot change
+        # the features, so they do not split the memo
+        key = " ".join(text.split())
+        return key.lower() if self.vectorizer.lowercase else key
+
+
+@dataclass
+class Prediction:
+    tag: str
+    confidence: float
+    response: str
+
+
+# ---------------------------
+# Fingerprinting
+# ---------------------------
+def fingerprint(intents_bytes: bytes, vectorizer_params: dict, classifier_params: dict) -> str:
+    h = hashlib.sha256()
+    h.update(intents_bytes)
+    h.update(
+        json.dumps(
+            {
+                "artifact_version": ARTIFACT_VERSION,
+                "sklearn": sklearn.__version__,
+                "vectorizer": vectorizer_params,
+                "classifier": classifier_params,
+            },
+            sort_keys=True,
+        ).encode("utf-8")
+    )
+    return h.hexdigest()[:16]
+
+
+def artifact_path(fp: str, artifact_dir: str = ARTIFACT_DIR) -> str:
+    return os.path.join(artifact_dir, f"intent_model-{fp}.pkl")
+
+
+# ---------------------------
+# Corpus compilation
+# ---------------------------
+def compile_responses(intents: list, classes, fallback_tag: str | None = None):
+    responses_by_tag = {}
+    for intent in intents:
+        # First occurrence of a duplicated tag wins, as with the old linear scan
+        responses_by_tag.setdefault(intent["tag"], tuple(intent["responses"]))
+
+    missing = [tag for tag in classes if not responses_by_tag.get(tag)]
+    if missing:
+        raise ValueError(f"No responses found in intents.json for tags: {', '.join(missing)}")
+
+    # A missing fallback tag is resolved here, once, rather than per request:
+    # the model is marked as having no fallback and low-confidence predictions
+    # keep the predicted tag's responses.
+    fallback_responses = None
+    if fallback_tag is not None:
+        fallback_responses = responses_by_tag.get(fallback_tag) or None
+        if fallback_responses is None:
+            warnings.warn(
+                f"Fallback tag '{fallback_tag}' not found in intents.json; "
+                "low-confidence predictions will use the predicted tag."
+            )
+
+    class_responses = [responses_by_tag[tag] for tag in classes]
+    return responses_by_tag, class_responses, fallback_responses
+
+
+# ---------------------------
+# Inference engine
+# ---------------------------
+def build_engine(vectorizer: TfidfVectorizer, clf: LogisticRegression, intents: list) -> LinearEngine | None:
+    # Exported once per model and checked against sklearn on the training
+    # patterns; on any disagreement inference stays on sklearn
+    engine = LinearEngine(vectorizer, clf)
+    patterns, _ = training_set(intents)
+    if not engine.matches(vectorizer, clf, patterns):
+        warnings.warn("NumPy inference engine does not match sklearn for this model; using sklearn.")
+        return None
+    return engine
+
+
+# ---------------------------
+# Training
+# ---------------------------
+def training_set(intents: list) -> tuple[list[str], list[str]]:
+    # (patterns, tags), one row per pattern
+    tags = []
+    patterns = []
+    for intent in intents:
+        for pattern in intent["patterns"]:
+            tags.append(intent["tag"])
+            patterns.append(pattern)
+    return patterns, tags
+
+
+def train_model(intents: list, vectorizer_params: dict, classifier_params: dict):
+    vectorizer = TfidfVectorizer(**vectorizer_params)
+    clf = LogisticRegression(**classifier_params)
+
+    patterns, tags = training_set(intents)
+    if not patterns:
+        raise ValueError("No patterns found in intents.json. Please populate the file.")
+
+    x = vectorizer.fit_transform(patterns)
+    clf.fit(x, tags)
+    return vectorizer, clf
+
+
+def _write_artifact(path: str, payload: dict):
+    # Write to a temp file and rename so concurrent workers never read a partial pickle
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_artifact(path: str, fp: str) -> dict | None:
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Corrupt or incompatible artifact: treat as stale and retrain
+        return None
+    if payload.get("version") != ARTIFACT_VERSION or payload.get("fingerprint") != fp:
+        return None
+    return payload
+
+
+def load_model(
+    intents_path: str = INTENTS_PATH,
+    vectorizer_params: dict = VECTORIZER_PARAMS,
+    classifier_params: dict = CLASSIFIER_PARAMS,
+    artifact_dir: str = ARTIFACT_DIR,
+    force: bool = False,
+    fallback_tag: str | None = None,
+) -> IntentModel:
+    with open(intents_path, "rb") as f:
+        intents_bytes = f.read()
+    intents = json.loads(intents_bytes)
+
+    fp = fingerprint(intents_bytes, vectorizer_params, classifier_params)
+    path = artifact_path(fp, artifact_dir)
+
+    payload = None if force else _read_artifact(path, fp)
+    if payload is None:
+        start = time.perf_counter()
+        vectorizer, clf = train_model(intents, vectorizer_params, classifier_params)
+        payload = {
+            "version": ARTIFACT_VERSION,
+            "fingerprint": fp,
+            "vectorizer": vectorizer,
+            "clf": clf,
+            "train_seconds": time.perf_counter() - start,
+        }
+        _write_artifact(path, payload)
+
+    responses_by_tag, class_responses, fallback_responses = compile_responses(
+        intents, payload["clf"].classes_, fallback_tag
+    )
+    return IntentModel(
+        fingerprint=fp,
+        vectorizer=payload["vectorizer"],
+        clf=payload["clf"],
+        intents=intents,
+        train_seconds=payload["train_seconds"],
+        responses_by_tag=responses_by_tag,
+        class_responses=class_responses,
+        fallback_responses=fallback_responses,
+        engine=build_engine(payload["vectorizer"], payload["clf"], intents),
+    )
+
+
+# ---------------------------
+# Incremental rebuild (hot reload)
+# ---------------------------
+def validate_intents(intents) -> None:
+    # Structural checks before a reloaded corpus may replace a working model
+    if not isinstance(intents, list):
+        raise ValueError("intents.json must contain a list of intents.")
+    for i, intent in enumerate(intents):
+        if not isinstance(intent, dict) or not isinstance(intent.get("tag"), str):
+            raise ValueError(f"Intent #{i} must be an object with a string 'tag'.")
+        for field in ("patterns", "responses"):
+            values = intent.get(field)
+            if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"Intent '{intent['tag']}': '{field}' must be a list of strings.")
+
+
+def update_model(
+    model: IntentModel,
+    intents_path: str = INTENTS_PATH,
+    vectorizer_params: dict = VECTORIZER_PARAMS,
+    classifier_params: dict = CLASSIFIER_PARAMS,
+    artifact_dir: str = ARTIFACT_DIR,
+    fallback_tag: str | None = None,
+) -> tuple[IntentModel, str]:
+    # Rebuilds `model` for the current intents file, redoing only what changed.
+    # Returns (model, mode), mode being the cheapest step that applied:
+    #   unchanged   same fingerprint, the model is returned as is
+    #   artifact    an artifact for the new fingerprint exists (e.g. an edit
+    #               was reverted) and is loaded
+    #   responses   same training set: vectorizer and classifier are reused
+    #   vocabulary  every new pattern term is already in the vocabulary: the
+    #               vocabulary is reused (IDF refit) and the classifier refit
+    #   warm-start  as vocabulary, with the classifier warm-started from the
+    #               old coefficients (same classes, solver other than liblinear,
+    #               which cannot warm-start)
+    #   full        anything else: a full retrain
+    # Raises ValueError / json.JSONDecodeError for an invalid corpus.
+    with open(intents_path, "rb") as f:
+        intents_bytes = f.read()
+    fp = fingerprint(intents_bytes, vectorizer_params, classifier_params)
+    if fp == model.fingerprint:
+        return model, "unchanged"
+    intents = json.loads(intents_bytes)
+    validate_intents(intents)
+
+    start = time.perf_counter()
+    patterns, tags = training_set(intents)
+    if not patterns:
+        raise ValueError("No patterns found in intents.json. Please populate the file.")
+    # Fail on tags without responses before spending time on training
+    compile_responses(intents, sorted(set(tags)))
+
+    payload = _read_artifact(artifact_path(fp, artifact_dir), fp)
+    if payload is not None:
+        vectorizer, clf, mode = payload["vectorizer"], payload["clf"], "artifact"
+    elif (patterns, tags) == training_set(model.intents):
+        vectorizer, clf, mode = model.vectorizer, model.clf, "responses"
+    else:
+        vocabulary = model.vectorizer.vocabulary_
+        analyzer = model.vectorizer.build_analyzer()
+        if all(term in vocabulary for pattern in patterns for term in analyzer(pattern)):
+            vectorizer = TfidfVectorizer(**vectorizer_params, vocabulary=vocabulary)
+            mode = "vocabulary"
+        else:
+            vectorizer = TfidfVectorizer(**vectorizer_params)
+            mode = "full"
+        x = vectorizer.fit_transform(patterns)
+
+        clf = LogisticRegression(**classifier_params)
+        if (
+            mode == "vocabulary"
+            and clf.solver != "liblinear"
+            and np.array_equal(np.unique(tags), model.clf.classes_)
+        ):
+            # fit() starts from coef_/intercept_ when warm_start is set
+            clf.set_params(warm_start=True)
+            clf.coef_ = model.clf.coef_.copy()
+            clf.intercept_ = model.clf.intercept_.copy()
+            mode = "warm-start"
+        clf.fit(x, tags)
+        clf.set_params(warm_start=False)
+    train_seconds = time.perf_counter() - start
+
+    # Only models identical to a full retrain are persisted under the
+    # fingerprint; vocabulary/warm-start builds live until the next restart.
+    incremental = mode in ("vocabulary", "warm-start") or (mode == "responses" and model.incremental)
+    if mode in ("responses", "full") and not incremental:
+        _write_artifact(
+            artifact_path(fp, artifact_dir),
+            {
+                "version": ARTIFACT_VERSION,
+                "fingerprint": fp,
+                "vectorizer": vectorizer,
+                "clf": clf,
+                "train_seconds": train_seconds,
+            },
+        )
+
+    responses_by_tag, class_responses, fallback_responses = compile_responses(intents, clf.classes_, fallback_tag)
+    new_model = IntentModel(
+        fingerprint=fp,
+        vectorizer=vectorizer,
+        clf=clf,
+        intents=intents,
+        train_seconds=train_seconds,
+        responses_by_tag=responses_by_tag,
+        class_responses=class_responses,
+        fallback_responses=fallback_responses,
+        incremental=incremental,
+        engine=build_engine(vectorizer, clf, intents),
+    )
+    return new_model, mode
+
+
+# ---------------------------
+# Inference
+# ---------------------------
+# One observation per chunk: for predict() that is the per-message latency
+INFERENCE_SECONDS = metrics.histogram("inference_seconds", "Time to classify one chunk of messages.")
+INFERENCE_MESSAGES = metrics.counter("inference_messages_total", "Messages classified.")
+INFERENCE_LOW_CONFIDENCE = metrics.counter(
+    "inference_low_confidence_total", "Predictions below the confidence threshold."
+)
+
+def predict_batch(
+    model: IntentModel,
+    texts: Iterable[str],
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    confidence_threshold: float = CONFIDENCE_THRESHOLD,
+) -> Iterator[Prediction]:
+    # One sparse transform and one predict_proba per chunk; chunks keep the
+    # dense probability matrix (chunk_size x n_classes) bounded.
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    texts = iter(texts)
+    while True:
+        chunk = list(islice(texts, chunk_size))
+        if not chunk:
+            return
+        with INFERENCE_SECONDS.time():
+            best, confidences = _score(model, chunk)
+        yield from _predictions(model, best, confidences, confidence_threshold)
+
+
+def _score(model: IntentModel, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    # (class index, confidence) per text: the engine for chunks it handles,
+    # one sparse transform and one sklearn predict_proba otherwise
+    if model.engine is not None and len(texts) <= ENGINE_MAX_CHUNK:
+        probabilities = model.engine.predict_proba(texts)
+    else:
+        probabilities = model.clf.predict_proba(model.vectorizer.transform(texts))
+    best = probabilities.argmax(axis=1)
+    return best, probabilities[np.arange(len(texts)), best]
+
+
+def _predictions(model: IntentModel, best, confidences, confidence_threshold: float) -> list[Prediction]:
+    # Per-row tail shared by predict and predict_batch: threshold, fallback
+    # responses and the message counters
+    classes = model.clf.classes_
+    predictions = []
+    low_confidence = 0
+    for class_index, confidence in zip(best, confidences):
+        confidence = float(confidence)
+        # fallback_responses is None when the fallback tag is missing
+        if confidence < confidence_threshold:
+            low_confidence += 1
+            responses = model.fallback_responses or model.class_responses[class_index]
+        else:
+            responses = model.class_responses[class_index]
+        predictions.append(Prediction(str(classes[class_index]), confidence, random.choice(responses)))
+    INFERENCE_MESSAGES.inc(len(predictions))
+    INFERENCE_LOW_CONFIDENCE.inc(low_confidence)
+    return predictions
+
+
+def predict(model: IntentModel, text: str, confidence_threshold: float = CONFIDENCE_THRESHOLD) -> Prediction:
+    # One-row predict_batch, with the prediction memo in front of the scoring
+    with INFERENCE_SECONDS.time():
+        key = model.memo_key(text)
+        scored = model.memo.get(key)
+        if scored is None:
+            best, confidences = _score(model, [text])
+            scored = int(best[0]), float(confidences[0])
+            model.memo.put(key, scored)
+    return _predictions(model, [scored[0]], [scored[1]], confidence_threshold)[0]
+
+
+# ---------------------------
+# Shared model holder
+# ---------------------------
+class ModelHolder:
+    # One read-only model shared by every session and rerun in the process.
+    # Callers take get() once per request and use that model throughout;
+    # swap() replaces the reference atomically, so a request that started on
+    # the old model finishes on it while new requests see the new one.
+    def __init__(
+        self,
+        loader: Callable[[bool], IntentModel],
+        updater: Callable[[IntentModel], tuple[IntentModel, str]] | None = None,
+    ):
+        self._loader = loader  # loader(force) -> IntentModel
+        self._updater = updater  # updater(current) -> (model, mode), see update_model
+        self._model = None
+        self._lock = threading.Lock()  # first build and swaps
+        self._reload_lock = threading.Lock()  # one rebuild at a time
+        self.generation = 0
+        self.last_reload = None  # {"mode", "seconds", "at", "error"} of the latest refresh()
+
+    def get(self) -> IntentModel:
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    # A failed build leaves the holder empty; the next get() retries
+                    self._model = self._loader(False)
+                    self.generation += 1
+                model = self._model
+        return model
+
+    def swap(self, model: IntentModel) -> IntentModel | None:
+        with self._lock:
+            old, self._model = self._model, model
+            self.generation += 1
+        return old
+
+    def reload(self, force: bool = False) -> IntentModel:
+        # Trains outside the swap lock: requests keep using the current model
+        # until the new one is ready
+        with self._reload_lock:
+            model = self._loader(force)
+            self.swap(model)
+            return model
+
+    def refresh(self) -> str:
+        # Incremental reload from disk; returns the update mode. On an invalid
+        # corpus the current model stays in place and the error is re-raised.
+        if self._updater is None:
+            self.reload()
+            return "full"
+        with self._reload_lock:
+            start = time.perf_counter()
+            try:
+                model, mode = self._updater(self.get())
+            except Exception as e:
+                RELOAD_FAILURES.inc()
+                self.last_reload = {"mode": None, "seconds": time.perf_counter() - start, "at": time.time(), "error": str(e)}
+                raise
+            seconds = time.perf_counter() - start
+            RELOAD_SECONDS[mode].observe(seconds)
+            if mode != "unchanged":
+                self.swap(model)
+                self.last_reload = {"mode": mode, "seconds": seconds, "at": time.time(), "error": None}
+            return mode
+
+
+RELOAD_SECONDS = {
+    mode: metrics.histogram("model_reload_seconds", "Time to rebuild and swap the model on reload.", mode=mode)
+    for mode in ("unchanged", "artifact", "responses", "vocabulary", "warm-start", "full")
+}
+RELOAD_FAILURES = metrics.counter("model_reload_failures_total", "Reloads rejected (invalid corpus or read error).")
+
+_holders = {}
+_holders_lock = threading.Lock()
+
+
+def get_model_holder(
+    intents_path: str = INTENTS_PATH,
+    vectorizer_params: dict = VECTORIZER_PARAMS,
+    classifier_params: dict = CLASSIFIER_PARAMS,
+    artifact_dir: str = ARTIFACT_DIR,
+    fallback_tag: str | None = None,
+) -> ModelHolder:
+    # Process-wide: Streamlit re-executes the app script on every interaction,
+    # but imported modules (and so this registry) live for the whole process
+    key = json.dumps(
+        [os.path.abspath(intents_path), vectorizer_params, classifier_params, os.path.abspath(artifact_dir), fallback_tag],
+        sort_keys=True,
+        default=str,
+    )
+    with _holders_lock:
+        holder = _holders.get(key)
+        if holder is None:
+            holder = _holders[key] = ModelHolder(
+                lambda force: load_model(
+                    intents_path, vectorizer_params, classifier_params, artifact_dir, force, fallback_tag
+                ),
+                lambda current: update_model(
+                    current, intents_path, vectorizer_params, classifier_params, artifact_dir, fallback_tag
+                ),
+            )
+        return holder
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the intent classifier artifact.")
+    parser.add_argument("--intents", default=INTENTS_PATH)
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--force", action="store_true", help="retrain even if the artifact is up to date")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = load_model(args.intents, artifact_dir=args.artifact_dir, force=args.force)
+    print(f"fingerprint: {model.fingerprint}")
+    print(f"artifact:    {artifact_path(model.fingerprint, args.artifact_dir)}")
+    print(f"train time:  {model.train_seconds:.3f}s")
+    print(f"load time:   {time.perf_counter() - start:.3f}s")
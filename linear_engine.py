@@ -0,0 +1,152 @@
+# linear_engine.py
+# -------------------------------------------------------------
+# Lean NumPy inference for the TF-IDF + LogisticRegression intent model
+#
+# sklearn's transform/predict_proba pay input validation and sparse-matrix
+# construction on every call, which dominates the cost of classifying one
+# short message. LinearEngine is exported once from a fitted vectorizer and
+# classifier:
+#   vocabulary   term -> column dict
+#   idf          float32 IDF weight per column
+#   weights      contiguous float32 matrix, one row per column (n_features x
+#                n_classes), so a message's terms gather whole rows
+#   intercepts   float32 per class
+# and scores a message with a sparse dot product (gather + weighted sum)
+# followed by the same probability link as sklearn: normalized sigmoids for
+# one-vs-rest models (liblinear), softmax for multinomial ones.
+#
+# Tokenization reuses the vectorizer's own analyzer, so terms are identical.
+# engine.matches() checks predictions against sklearn; intent_model only
+# uses an engine that passes on the training patterns.
+#
+# How to run (agreement and speed against sklearn on intents.json):
+#   python linear_engine.py
+# -------------------------------------------------------------
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+MATCH_ATOL = 1e-4  # float32 vs float64 probabilities
+
+
+class LinearEngine:
+    def __init__(self, vectorizer: TfidfVectorizer, clf: LogisticRegression):
+        self.analyzer = vectorizer.build_analyzer()
+        self.vocabulary = dict(vectorizer.vocabulary_)
+        self.binary = vectorizer.binary
+        self.sublinear_tf = vectorizer.sublinear_tf
+        self.norm = vectorizer.norm
+        n_features = len(self.vocabulary)
+        if vectorizer.use_idf:
+            self.idf = np.asarray(vectorizer.idf_, dtype=np.float32)
+        else:
+            self.idf = np.ones(n_features, dtype=np.float32)
+
+        self.classes = clf.classes_
+        coef = np.asarray(clf.coef_, dtype=np.float32)
+        intercept = np.broadcast_to(np.asarray(clf.intercept_, dtype=np.float32), (coef.shape[0],))
+        # Binary models keep a single decision column, as sklearn does
+        self.weights = np.ascontiguousarray(coef.T)
+        self.intercepts = np.ascontiguousarray(intercept)
+        self.binary_decision = coef.shape[0] == 1
+
+        # Same rule as LogisticRegression.predict_proba
+        multi_class = getattr(clf, "multi_class", "auto")
+        self.ovr = multi_class in ("ovr", "warn") or (
+            multi_class in ("auto", "deprecated") and (len(self.classes) <= 2 or clf.solver == "liblinear")
+        )
+
+    # ---------------------------
+    # Scoring
+    # ---------------------------
+    def features(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        # (columns, tf-idf values) of one message
+        counts = {}
+        vocabulary = self.vocabulary
+        for term in self.analyzer(text):
+            col = vocabulary.get(term)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        cols = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        if self.binary:
+            values[:] = 1.0
+        elif self.sublinear_tf:
+            values = np.log(values) + 1.0
+        values *= self.idf[cols]
+        if self.norm == "l2":
+            values /= np.sqrt(np.dot(values, values))
+        elif self.norm == "l1":
+            values /= np.abs(values).sum()
+        return cols, values
+
+    def decision(self, text: str) -> np.ndarray:
+        cols, values = self.features(text)
+        return values @ self.weights[cols] + self.intercepts
+
+    def probabilities(self, decision: np.ndarray) -> np.ndarray:
+        if self.binary_decision:
+            d = decision[0]
+            if self.ovr:
+                p = 1.0 / (1.0 + np.exp(-d))
+                return np.array([1.0 - p, p], dtype=np.float32)
+            decision = np.array([-d, d], dtype=np.float32)
+        elif self.ovr:
+            p = 1.0 / (1.0 + np.exp(-decision))
+            return p / p.sum()
+        e = np.exp(decision - decision.max())
+        return e / e.sum()
+
+    def predict_proba(self, texts) -> np.ndarray:
+        return np.vstack([self.probabilities(self.decision(t)) for t in texts])
+
+    def best(self, text: str) -> tuple[int, float]:
+        # (class index, confidence) of one message
+        p = self.probabilities(self.decision(text))
+        i = int(p.argmax())
+        return i, float(p[i])
+
+    # ---------------------------
+    # Verification
+    # ---------------------------
+    def matches(self, vectorizer: TfidfVectorizer, clf: LogisticRegression, texts: list[str]) -> bool:
+        # Same argmax everywhere and probabilities within MATCH_ATOL of sklearn
+        if not texts:
+            return True
+        expected = clf.predict_proba(vectorizer.transform(texts))
+        actual = self.predict_proba(texts)
+        if expected.shape != actual.shape:
+            return False
+        # Ties may break differently in float32; compare the winning probability
+        rows = np.arange(len(texts))
+        same_best = np.isclose(
+            expected[rows, actual.argmax(axis=1)], expected.max(axis=1), rtol=0, atol=MATCH_ATOL
+        )
+        return bool(same_best.all() and np.allclose(expected, actual, rtol=0, atol=MATCH_ATOL))
+
+
+if __name__ == "__main__":
+    import time
+    import warnings
+
+    from intent_model import load_model, training_set
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    model = load_model()
+    engine = LinearEngine(model.vectorizer, model.clf)
+    patterns, _ = training_set(model.intents)
+    probes = patterns + [p.lower() + " please" for p in patterns] + ["", "zzz qqq", "hello hello hello"]
+    print(f"matches sklearn on {len(probes)} messages: {engine.matches(model.vectorizer, model.clf, probes)}")
+
+    def per_call(fn) -> float:
+        start = time.perf_counter()
+        for text in probes:
+            fn(text)
+        return (time.perf_counter() - start) / len(probes)
+
+    sk = per_call(lambda t: model.clf.predict_proba(model.vectorizer.transform([t])))
+    fast = per_call(engine.best)
+    print(f"sklearn: {sk * 1e6:.1f} us/message   engine: {fast * 1e6:.1f} us/message   ({sk / fast:.1f}x)")
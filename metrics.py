@@ -0,0 +1,265 @@
+# metrics.py
+# -------------------------------------------------------------
+# In-process metrics registry: counters and fixed-bucket histograms
+#
+# Hot paths create their metrics once at import time and then only touch
+# the metric object: a counter increment or a histogram observation is a
+# bisect plus a few additions under a per-metric lock, with no allocation.
+# Percentiles are estimated from the buckets (linear interpolation inside
+# the bucket, as Prometheus' histogram_quantile does), so memory stays
+# constant however many observations are recorded.
+#
+# Metrics are per process: the Streamlit dashboard shows what its own
+# server process has served. render_prometheus() produces the Prometheus
+# text exposition format; start_http_server(port) serves it on /metrics.
+# -------------------------------------------------------------
+
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# Seconds; spans sub-millisecond inference up to slow PDF extractions
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+PROCESS_START = time.time()
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _Timer:
+    # Plain class rather than @contextmanager: no generator per call
+    __slots__ = ("_histogram", "_errors", "_start")
+
+    def __init__(self, histogram: "Histogram", errors: Counter | None):
+        self._histogram = histogram
+        self._errors = errors
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start)
+        if exc_type is not None and self._errors is not None:
+            self._errors.inc()
+        return False
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self, errors: Counter | None = None) -> _Timer:
+        # with hist.time(errors): ... records the duration, and counts an
+        # error when the block raises
+        return _Timer(self, errors)
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def quantile(self, q: float) -> float | None:
+        counts, _, total = self.snapshot()
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, n in enumerate(counts):
+            if cumulative + n >= rank and n:
+                if i == len(self.buckets):
+                    # Beyond the last bound: report the bound, as Prometheus does
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / n
+            cumulative += n
+        return self.buckets[-1]
+
+
+# ---------------------------
+# Registry
+# ---------------------------
+# A collector returns gauge samples computed at scrape time:
+# iterable of (name, help, labels, value)
+Collector = Callable[[], Iterable[tuple[str, str, dict, float]]]
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    items = key + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # name -> (type, help, {labels_key: metric})
+        self._collectors = []
+
+    def _get(self, kind: str, name: str, help: str, labels: dict, factory):
+        key = _labels_key(labels)
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help, {})
+            elif family[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get("counter", name, help, labels, Counter)
+
+    def histogram(self, name: str, help: str = "", buckets: Iterable[float] = DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def register_collector(self, collector: Collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def get(self, name: str, **labels):
+        family = self._families.get(name)
+        return None if family is None else family[2].get(_labels_key(labels))
+
+    def total(self, name: str) -> float:
+        # Sum of a counter across all its label sets
+        family = self._families.get(name)
+        if family is None:
+            return 0.0
+        return sum(m.value for m in list(family[2].values()))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            families = sorted((name, (kind, help, dict(members))) for name, (kind, help, members) in self._families.items())
+            collectors = list(self._collectors)
+        for name, (kind, help, members) in families:
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in sorted(members.items()):
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(metric.value)}")
+                    continue
+                counts, total_sum, count = metric.snapshot()
+                cumulative = 0
+                for bound, n in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total_sum)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        gauges = {}
+        for collector in collectors:
+            for name, help, labels, value in collector():
+                gauges.setdefault(name, (help, []))[1].append((_labels_key(labels), value))
+        for name, (help, samples) in sorted(gauges.items()):
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in samples:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+register_collector = REGISTRY.register_collector
+render_prometheus = REGISTRY.render_prometheus
+
+
+def _process_metrics():
+    yield "process_start_time_seconds", "Start time of the process (unix seconds).", {}, PROCESS_START
+    yield "process_uptime_seconds", "Seconds since the process started.", {}, time.time() - PROCESS_START
+
+
+register_collector(_process_metrics)
+
+
+# ---------------------------
+# /metrics endpoint
+# ---------------------------
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1"):
+    # Serves render_prometheus() on a daemon thread; once per process, so
+    # Streamlit reruns calling it again are no-ops.
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((addr, port), Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
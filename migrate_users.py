@@ -0,0 +1,214 @@
+# migrate_users.py
+# -------------------------------------------------------------
+# Consolidate the user databases into one schema-versioned store
+#
+# The target is brought up to the current schema (db.migrate) and every user,
+# and any documents, from the source databases are copied into it, in one
+# transaction per source:
+#   milestone1.db   users (BLOB hash) + documents
+#   users.db        users with reset_token
+#   simplifier.db   SQLAlchemy users (text hash, DATETIME created_at)
+# Emails are normalized (trimmed, lowercased). When an email is already in the
+# target, the target's account is kept. If the password hashes differ, the
+# email is reported as a conflict. Documents are re-keyed to the target's
+# user ids and deduplicated per user by content hash, as save_document does.
+# Rows are written with executemany, and existing users and documents are
+# read once per source rather than once per row.
+#
+# --dry-run migrates and merges into a temporary copy of the target, so the
+# target itself is never opened for writing - not even for the schema upgrade.
+#
+# How to run:
+#   python migrate_users.py users.db Springboard/simplifier.db
+#   python migrate_users.py --target milestone1.db --dry-run users.db
+# -------------------------------------------------------------
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+
+import db
+
+LOOKUP_CHUNK_SIZE = 500  # emails per IN (...) query
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _normalize_hash(value) -> bytes:
+    # simplifier.db stored the bcrypt hash as text
+    return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+
+def _normalize_created(value) -> str:
+    # SQLAlchemy's DATETIME text uses a space separator; db.py uses isoformat
+    if not value:
+        return datetime.utcnow().isoformat()
+    return str(value).replace(" ", "T", 1)
+
+
+def _user_ids(conn: sqlite3.Connection, emails: list[str]) -> dict[str, int]:
+    ids = {}
+    for i in range(0, len(emails), LOOKUP_CHUNK_SIZE):
+        chunk = emails[i : i + LOOKUP_CHUNK_SIZE]
+        marks = ",".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT id, email FROM users WHERE email IN ({marks})", chunk):
+            ids[row[1]] = row[0]
+    return ids
+
+
+def merge_source(target: sqlite3.Connection, source_path: str) -> dict:
+    # Copies one source database into the open target transaction
+    report = {"users_added": 0, "users_existing": 0, "conflicts": [], "documents_added": 0, "documents_duplicate": 0}
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in source.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if "users" not in tables:
+            return report
+        cols = _columns(source, "users")
+        reset = "reset_token" if "reset_token" in cols else "NULL"
+        created = "created_at" if "created_at" in cols else "NULL"
+        users = source.execute(f"SELECT id, email, password_hash, {reset}, {created} FROM users").fetchall()
+
+        existing = {
+            row[0]: (_normalize_hash(row[1]), row[2])
+            for row in target.execute("SELECT email, password_hash, reset_token FROM users")
+        }
+        new_users, token_updates, source_emails = {}, [], {}
+        for source_id, email, pw_hash, token, created_at in users:
+            email = email.strip().lower()
+            source_emails[source_id] = email
+            pw_hash = _normalize_hash(pw_hash)
+            if email in existing:
+                report["users_existing"] += 1
+                target_hash, target_token = existing[email]
+                if target_hash != pw_hash:
+                    report["conflicts"].append(email)
+                elif token and not target_token:
+                    token_updates.append((token, email))
+            elif email not in new_users:
+                new_users[email] = (email, pw_hash, token, _normalize_created(created_at))
+        target.executemany(
+            "INSERT INTO users(email, password_hash, reset_token, created_at) VALUES(?,?,?,?)",
+            list(new_users.values()),
+        )
+        target.executemany("UPDATE users SET reset_token=? WHERE email=? AND reset_token IS NULL", token_updates)
+        report["users_added"] = len(new_users)
+
+        if "documents" in tables:
+            ids = _user_ids(target, sorted(set(source_emails.values())))
+            seen = {(row[0], row[1]) for row in target.execute("SELECT user_id, content_hash FROM documents")}
+            new_docs = []
+            for user_id, filename, mime, content, created_at in source.execute(
+                "SELECT user_id, filename, mime, content, created_at FROM documents ORDER BY id"
+            ):
+                target_user = ids.get(source_emails.get(user_id))
+                if target_user is None:
+                    continue  # orphaned document in the source
+                digest = db.content_hash(content)
+                if (target_user, digest) in seen:
+                    report["documents_duplicate"] += 1
+                    continue
+                seen.add((target_user, digest))
+                new_docs.append(
+                    (
+                        target_user,
+                        filename,
+                        mime,
+                        content,
+                        _normalize_created(created_at),
+                        content[: db.PREVIEW_CHARS],
+                        len(content),
+                        digest,
+                    )
+                )
+            target.executemany(db.SQL_INSERT_DOCUMENT, new_docs)
+            report["documents_added"] = len(new_docs)
+        return report
+    finally:
+        source.close()
+
+
+def _copy_database(path: str) -> str:
+    # Snapshot of path (empty if it does not exist yet) in a temporary file
+    fd, copy_path = tempfile.mkstemp(prefix="migrate_users_", suffix=".db")
+    os.close(fd)
+    if os.path.exists(path):
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        copy = sqlite3.connect(copy_path)
+        try:
+            source.backup(copy)
+        finally:
+            copy.close()
+            source.close()
+    return copy_path
+
+
+def consolidate(target_path: str, sources: list[str], dry_run: bool = False) -> dict[str, dict]:
+    work_path = _copy_database(target_path) if dry_run else target_path
+    target = db._connect(work_path)
+    try:
+        before, after = db.migrate(target)
+        if dry_run and before != after:
+            print(f"{target_path}: schema v{before} -> v{after} pending (applied to a copy only)")
+        else:
+            print(f"{target_path}: schema v{before} -> v{after}")
+        reports = {}
+        for path in sources:
+            if not os.path.exists(path):
+                print(f"{path}: not found, skipped")
+                continue
+            if os.path.abspath(path) == os.path.abspath(target_path):
+                continue
+            start = time.perf_counter()
+            target.execute("BEGIN IMMEDIATE")
+            try:
+                report = merge_source(target, path)
+                if dry_run:
+                    target.rollback()
+                else:
+                    target.commit()
+            except BaseException:
+                target.rollback()
+                raise
+            report["seconds"] = time.perf_counter() - start
+            reports[path] = report
+            print(
+                f"{path}: {report['users_added']} users added, {report['users_existing']} already present "
+                f"({len(report['conflicts'])} with a different password), "
+                f"{report['documents_added']} documents added, {report['documents_duplicate']} duplicates "
+                f"[{report['seconds'] * 1000:.0f} ms]"
+            )
+            for email in report["conflicts"]:
+                print(f"  conflict: {email} keeps its existing password")
+        if not dry_run:
+            target.execute("PRAGMA optimize")
+        return reports
+    finally:
+        target.close()
+        if dry_run:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(work_path + suffix):
+                    os.remove(work_path + suffix)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Merge user databases into one store.")
+    parser.add_argument("sources", nargs="*", help="databases to merge (default: users.db, simplifier.db)")
+    parser.add_argument("--target", default=db.DB_PATH, help=f"store to merge into (default {db.DB_PATH})")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, then roll back")
+    args = parser.parse_args(argv)
+    sources = args.sources or ["users.db", "simplifier.db", os.path.join("Springboard", "simplifier.db")]
+    consolidate(args.target, sources, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"dry run: {args.target} was not modified")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
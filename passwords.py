@@ -0,0 +1,149 @@
+# passwords.py
+# -------------------------------------------------------------
+# bcrypt hashing behind a bounded worker pool
+#
+# bcrypt releases the GIL while it hashes, so running it on a small thread
+# pool caps how many hashes burn CPU at once and lets the rest queue, instead
+# of every Streamlit session hashing on its own script thread. The queue is
+# bounded: when it is full, callers get PasswordHasherBusy rather than piling
+# up behind a login spike.
+#
+# Configuration (environment variables):
+#   BCRYPT_ROUNDS   cost factor for new hashes (default 12)
+#   BCRYPT_WORKERS  hashing threads (default: CPU count, max 8)
+#   BCRYPT_QUEUE    max hashes waiting for a worker (default 64)
+# -------------------------------------------------------------
+
+import os
+import time
+import bcrypt
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", str(min(8, os.cpu_count() or 1))))
+BCRYPT_QUEUE = int(os.environ.get("BCRYPT_QUEUE", "64"))
+QUEUE_TIMEOUT = 5.0  # seconds to wait for a queue slot
+
+LATENCY_WINDOW = 1024  # recent operations kept for percentiles
+
+
+class PasswordHasherBusy(RuntimeError):
+    pass
+
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+# Slots for running + queued operations
+_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE)
+
+_stats_lock = threading.Lock()
+_pending = 0
+_running = 0
+_completed = 0
+_rejected = 0
+_latencies = deque(maxlen=LATENCY_WINDOW)  # seconds, submit -> result
+_hash_times = deque(maxlen=LATENCY_WINDOW)  # seconds, time spent in bcrypt
+
+
+def _timed(fn, *args):
+    global _running
+    with _stats_lock:
+        _running += 1
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            _running -= 1
+            _hash_times.append(elapsed)
+
+
+def _run(fn, *args):
+    global _pending, _completed, _rejected
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+        with _stats_lock:
+            _rejected += 1
+        raise PasswordHasherBusy("The server is busy. Please try again in a moment.")
+    start = time.perf_counter()
+    with _stats_lock:
+        _pending += 1
+    try:
+        return _executor.submit(_timed, fn, *args).result()
+    finally:
+        _slots.release()
+        with _stats_lock:
+            _pending -= 1
+            _completed += 1
+            _latencies.append(time.perf_counter() - start)
+
+
+# ---------------------------
+# Public API
+# ---------------------------
+def hash_password(password: str, rounds: int | None = None) -> bytes:
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return _run(bcrypt.hashpw, password.encode("utf-8"), salt)
+
+
+def check_password(password: str, hashed: bytes) -> bool:
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+    return _run(bcrypt.checkpw, password.encode("utf-8"), hashed)
+
+
+def hash_cost(hashed: bytes) -> int | None:
+    # bcrypt hashes carry their cost: $2b$12$<salt+hash>
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+    parts = hashed.split(b"$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed: bytes) -> bool:
+    return hash_cost(hashed) != BCRYPT_ROUNDS
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stats() -> dict:
+    with _stats_lock:
+        latencies = list(_latencies)
+        hash_times = list(_hash_times)
+        return {
+            "rounds": BCRYPT_ROUNDS,
+            "workers": BCRYPT_WORKERS,
+            "queue_capacity": BCRYPT_QUEUE,
+            "running": _running,
+            "queued": max(0, _pending - _running),
+            "completed": _completed,
+            "rejected": _rejected,
+            "latency_p50_ms": _percentile(latencies, 0.50) * 1000,
+            "latency_p95_ms": _percentile(latencies, 0.95) * 1000,
+            "hash_p50_ms": _percentile(hash_times, 0.50) * 1000,
+        }
+
+
+def _collect_metrics():
+    # Exposes stats() on the metrics registry (gauges, computed at scrape time)
+    s = stats()
+    yield "bcrypt_running", "bcrypt operations running on a worker.", {}, s["running"]
+    yield "bcrypt_queued", "bcrypt operations waiting for a worker.", {}, s["queued"]
+    yield "bcrypt_completed", "bcrypt operations completed.", {}, s["completed"]
+    yield "bcrypt_rejected", "bcrypt operations rejected with a full queue.", {}, s["rejected"]
+    yield "bcrypt_latency_p95_seconds", "Recent submit-to-result latency, 95th percentile.", {}, s["latency_p95_ms"] / 1000
+    yield "bcrypt_hash_p50_seconds", "Recent time spent hashing, median.", {}, s["hash_p50_ms"] / 1000
+
+
+metrics.register_collector(_collect_metrics)
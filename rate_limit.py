@@ -0,0 +1,110 @@
+# rate_limit.py
+# -------------------------------------------------------------
+# In-memory token-bucket rate limiter
+#
+# Each key (e.g. "email:alice@example.com" or "session:<id>") owns a bucket
+# of `capacity` tokens that refills continuously at `refill_per_sec`. An
+# attempt takes one token; with no token left it is rejected immediately,
+# before any expensive work. A bucket is stored as a two-item list
+# [tokens, updated_at]; once it has refilled completely it carries no
+# information and is evicted, which bounds memory to the keys that are
+# actually being throttled.
+#
+# Time is wall-clock (time.time) so state can be persisted and restored
+# across restarts with dump()/restore(). changes() returns only what moved
+# since the previous call - buckets touched, and buckets reset or evicted -
+# so processes sharing one table each write just their own keys.
+# -------------------------------------------------------------
+
+import time
+import threading
+
+SWEEP_EVERY = 1024  # operations between eviction sweeps
+
+
+class TokenBucketLimiter:
+    def __init__(self, capacity: int, refill_per_sec: float):
+        self.capacity = float(capacity)
+        self.refill_per_sec = refill_per_sec
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._ops = 0
+        self._changed = set()  # keys touched since the last changes()
+        self._removed = {}  # key -> updated_at of the bucket when it was reset or evicted
+
+    @property
+    def ttl(self) -> float:
+        # Seconds for an empty bucket to refill completely
+        return self.capacity / self.refill_per_sec
+
+    def _tokens(self, bucket, now: float) -> float:
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_sec)
+
+    def check(self, key: str, now: float | None = None) -> tuple[bool, float]:
+        # Like try_acquire, but takes no token
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = self.capacity if bucket is None else self._tokens(bucket, now)
+            if tokens < 1.0:
+                return False, (1.0 - tokens) / self.refill_per_sec
+            return True, 0.0
+
+    def try_acquire(self, key: str, now: float | None = None) -> tuple[bool, float]:
+        # Returns (allowed, retry_after_seconds)
+        now = time.time() if now is None else now
+        with self._lock:
+            self._maybe_sweep(now)
+            bucket = self._buckets.get(key)
+            tokens = self.capacity if bucket is None else self._tokens(bucket, now)
+            self._changed.add(key)
+            self._removed.pop(key, None)
+            if tokens < 1.0:
+                self._buckets[key] = [tokens, now]
+                return False, (1.0 - tokens) / self.refill_per_sec
+            self._buckets[key] = [tokens - 1.0, now]
+            return True, 0.0
+
+    def reset(self, key: str, now: float | None = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._buckets.pop(key, None)
+            self._changed.discard(key)
+            self._removed[key] = now
+
+    def _maybe_sweep(self, now: float):
+        self._ops += 1
+        if self._ops % SWEEP_EVERY:
+            return
+        expired = [k for k, b in self._buckets.items() if now - b[1] >= self.ttl]
+        for k in expired:
+            self._changed.discard(k)
+            self._removed[k] = self._buckets.pop(k)[1]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def dump(self, now: float | None = None) -> list[tuple[str, float, float]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            return [(k, b[0], b[1]) for k, b in self._buckets.items() if now - b[1] < self.ttl]
+
+    def changes(self) -> tuple[list[tuple[str, float, float]], list[tuple[str, float]]]:
+        # (buckets touched, (key, updated_at) of buckets reset or evicted)
+        # since the previous call
+        with self._lock:
+            touched = [(k, *self._buckets[k]) for k in self._changed if k in self._buckets]
+            removed = list(self._removed.items())
+            self._changed.clear()
+            self._removed.clear()
+        return touched, removed
+
+    def restore(self, rows, now: float | None = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for key, tokens, updated_at in rows:
+                if now - updated_at < self.ttl:
+                    self._buckets[key] = [tokens, updated_at]
@@ -0,0 +1,124 @@
+# retrieval_engine.py
+# -------------------------------------------------------------
+# Nearest-neighbour intent retrieval over pattern TF-IDF vectors
+#
+# An alternative to the classifier: every pattern in intents.json is stored
+# as its L2-normalized TF-IDF vector, and a message is answered with the tag
+# of the most similar pattern (cosine similarity, which for unit vectors is
+# a dot product). The index is a sparse patterns x terms matrix kept in CSC
+# form, i.e. an inverted index: a query only touches the columns of its own
+# non-zero terms, and all patterns are scored in one sparse product.
+#
+# Nothing is trained. The vectorizer (vocabulary + IDF) comes from the
+# loaded intent model, and new patterns - including brand-new tags - are
+# added by appending rows with add(); terms outside the fitted vocabulary
+# are ignored until the next full rebuild from intents.json.
+# -------------------------------------------------------------
+
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from intent_model import IntentModel, training_set
+
+
+@dataclass
+class Match:
+    tag: str
+    pattern: str
+    similarity: float
+
+
+class PatternIndex:
+    def __init__(self, vectorizer: TfidfVectorizer, featurizer: Callable[[str], tuple] | None = None):
+        if vectorizer.norm != "l2":
+            raise ValueError("PatternIndex needs an L2-normalizing vectorizer for cosine similarity.")
+        self.vectorizer = vectorizer
+        # featurizer(text) -> (columns, values) for queries, e.g. LinearEngine.features,
+        # which skips sklearn's per-call validation; patterns go through the vectorizer
+        self.featurizer = featurizer
+        self.responses_by_tag = {}
+        self._lock = threading.Lock()  # serializes add()
+        # (matrix, tags, patterns) swapped as one tuple so readers always see a
+        # consistent snapshot while add() builds the next one
+        self._snapshot = (sp.csc_matrix((0, len(vectorizer.vocabulary_)), dtype=np.float64), (), ())
+
+    @classmethod
+    def from_model(cls, model: IntentModel) -> "PatternIndex":
+        index = cls(model.vectorizer, model.engine.features if model.engine is not None else None)
+        patterns, tags = training_set(model.intents)
+        index.responses_by_tag.update(model.responses_by_tag)
+        index._append(patterns, tags)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._snapshot[1])
+
+    def _append(self, patterns: list[str], tags: list[str]):
+        with self._lock:
+            matrix, old_tags, old_patterns = self._snapshot
+            rows = self.vectorizer.transform(patterns)
+            matrix = sp.vstack([matrix, rows], format="csc")
+            self._snapshot = (matrix, old_tags + tuple(tags), old_patterns + tuple(patterns))
+
+    def add(self, tag: str, patterns: list[str], responses: list[str] | None = None):
+        # Appends without retraining. Responses are required for a new tag.
+        if responses:
+            self.responses_by_tag[tag] = tuple(responses)
+        elif tag not in self.responses_by_tag:
+            raise ValueError(f"New tag '{tag}' needs responses.")
+        self._append(list(patterns), [tag] * len(patterns))
+
+    def search(self, text: str, k: int = 5) -> list[Match]:
+        # Top-k patterns by cosine similarity, best first
+        matrix, tags, patterns = self._snapshot
+        if self.featurizer is not None:
+            cols, values = self.featurizer(text)
+        else:
+            query = self.vectorizer.transform([text])
+            cols, values = query.indices, query.data
+        if not len(tags) or not len(cols):
+            return []
+        # Inverted-index scoring straight off the CSC arrays: only the postings
+        # of the query's terms are read, and one bincount accumulates them
+        starts = matrix.indptr[cols]
+        lengths = matrix.indptr[cols + 1] - starts
+        # Positions of all postings: each run starts[i] .. starts[i] + lengths[i]
+        offsets = np.cumsum(lengths) - lengths
+        postings = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+        weights = matrix.data[postings] * np.repeat(values, lengths)
+        scores = np.bincount(matrix.indices[postings], weights=weights, minlength=len(tags))
+        if k == 1:
+            top = [int(scores.argmax())]
+        else:
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+        # Patterns sharing no term with the query score 0 and are not matches
+        return [Match(tags[i], patterns[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def best(self, text: str) -> Match | None:
+        matches = self.search(text, k=1)
+        return matches[0] if matches else None
+
+
+# ---------------------------
+# Shared index
+# ---------------------------
+# One index per loaded model, rebuilt when a reload changes the fingerprint
+_index = None
+_index_fingerprint = None
+_index_lock = threading.Lock()
+
+
+def index_for_model(model: IntentModel) -> PatternIndex:
+    global _index, _index_fingerprint
+    with _index_lock:
+        if _index is None or _index_fingerprint != model.fingerprint:
+            _index = PatternIndex.from_model(model)
+            _index_fingerprint = model.fingerprint
+        return _index